@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
-from api.models import Ingredient, Recipe, Unit, Quantity, RecipeIngredient
+from api.models import Ingredient, Recipe, Unit, Quantity, RecipeIngredient, ImportJob, \
+    PersistedQuery
 
 
 class RecipeAdmin(admin.ModelAdmin):
@@ -14,3 +15,5 @@ admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Unit)
 admin.site.register(Quantity)
 admin.site.register(RecipeIngredient)
+admin.site.register(ImportJob)
+admin.site.register(PersistedQuery)
@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models import AutoField, CharField, IntegerField, TextField
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from api import autocomplete, cache, ingredient_stats, makeability, pantry_status, \
+            search_index
+        from api.search import AnyOf, TrigramWordSimilar, set_trigram_threshold
+
+        CharField.register_lookup(TrigramWordSimilar)
+        TextField.register_lookup(TrigramWordSimilar)
+        AutoField.register_lookup(AnyOf)
+        IntegerField.register_lookup(AnyOf)
+        connection_created.connect(set_trigram_threshold)
+        search_index.connect_signals()
+        autocomplete.connect_signals()
+        makeability.connect_signals()
+        pantry_status.connect_signals()
+        ingredient_stats.connect_signals()
+        cache.connect_signals()
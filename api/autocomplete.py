@@ -0,0 +1,233 @@
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.db.models import Count
+
+from api.models import Ingredient, Recipe
+
+INGREDIENT = 'ingredient'
+RECIPE = 'recipe'
+SOURCE = 'source'
+KINDS = (INGREDIENT, RECIPE, SOURCE)
+
+# prefixes up to this long match too many keys to scan per keystroke, their best completions are
+# ranked once and kept until an entry under them changes
+SHORT_PREFIX = 3
+TOP_COMPLETIONS = 50
+# longer prefixes scan at most this many keys
+MAX_SCAN = 2000
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).lower().split())
+
+
+def _keys(label):
+    # every word of a label is a starting point, so "chart" completes "Green Chartreuse"
+    words = normalize(label).split(' ')
+    return {' '.join(words[start:]) for start in range(len(words)) if words[start]}
+
+
+class AutocompleteIndex(object):
+    '''
+    Sorted array of (key, kind, entity) tuples over ingredient names, recipe names and sources,
+    searched with bisect.  Ingredients are weighted by how many recipes use them, recipes by
+    rating and sources by how many recipes cite them.  The best completions of short prefixes
+    are kept ranked, longer prefixes match few enough keys to rank them as they are asked for.
+
+    Like the search index it is built on first use, recipes and ingredients are marked dirty
+    from model signals and the dirty ones are reloaded in a batch by the next completion.
+    '''
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._keys = []
+        self._entries = {}
+        self._recipe_sources = {}
+        self._source_counts = Counter()
+        self._dirty_recipes = set()
+        self._dirty_ingredients = set()
+        self._top = {}
+
+    def build(self):
+        with self._lock:
+            self._keys = []
+            self._entries = {}
+            self._recipe_sources = {}
+            self._source_counts = Counter()
+            self._dirty_recipes = set()
+            self._dirty_ingredients = set()
+            self._top = {}
+            self._load_ingredients(Ingredient.objects.all())
+            for recipe in Recipe.objects.only('id', 'name', 'source', 'rating'):
+                self._add_entry(RECIPE, recipe.id, recipe.name, recipe.rating or 0)
+                self._recipe_sources[recipe.id] = recipe.source
+                if recipe.source:
+                    self._source_counts[recipe.source] += 1
+            for source, count in self._source_counts.items():
+                self._add_entry(SOURCE, source, source, count)
+            self._keys.sort()
+            self._built = True
+
+    def mark_recipes_dirty(self, recipe_ids=None):
+        with self._lock:
+            if not self._built:
+                return
+            if recipe_ids is None:
+                self._built = False
+            else:
+                self._dirty_recipes.update(recipe_ids)
+
+    def mark_ingredients_dirty(self, ingredient_ids):
+        with self._lock:
+            if self._built:
+                self._dirty_ingredients.update(ingredient_ids)
+
+    def _add_entry(self, kind, entity, label, weight):
+        # while building, keys are appended and sorted once at the end
+        keys = _keys(label)
+        self._entries[(kind, entity)] = (label, weight, keys, normalize(label))
+        for key in keys:
+            if self._built:
+                insort(self._keys, (key, kind, entity))
+                self._forget_top(key)
+            else:
+                self._keys.append((key, kind, entity))
+
+    def _forget_top(self, key):
+        for length in range(1, SHORT_PREFIX + 1):
+            self._top.pop(key[:length], None)
+
+    def _set_entry(self, kind, entity, label, weight):
+        self._remove_entry(kind, entity)
+        self._add_entry(kind, entity, label, weight)
+
+    def _remove_entry(self, kind, entity):
+        entry = self._entries.pop((kind, entity), None)
+        if entry:
+            for key in entry[2]:
+                del self._keys[bisect_left(self._keys, (key, kind, entity))]
+                self._forget_top(key)
+
+    def _count_source(self, source, change):
+        if not source:
+            return
+        self._source_counts[source] += change
+        if self._source_counts[source] > 0:
+            self._set_entry(SOURCE, source, source, self._source_counts[source])
+        else:
+            del self._source_counts[source]
+            self._remove_entry(SOURCE, source)
+
+    def _load_ingredients(self, ingredients):
+        for ingredient in ingredients.annotate(recipe_count=Count('recipeingredient')):
+            self._add_entry(INGREDIENT, ingredient.id, ingredient.name, ingredient.recipe_count)
+
+    def _load_recipes(self, recipes):
+        for recipe in recipes.only('id', 'name', 'source', 'rating'):
+            self._set_entry(RECIPE, recipe.id, recipe.name, recipe.rating or 0)
+            self._count_source(self._recipe_sources.get(recipe.id), -1)
+            self._recipe_sources[recipe.id] = recipe.source
+            self._count_source(recipe.source, 1)
+
+    def _refresh(self):
+        if not self._built:
+            self.build()
+            return
+        if self._dirty_ingredients:
+            dirty, self._dirty_ingredients = self._dirty_ingredients, set()
+            for ingredient_id in dirty:
+                self._remove_entry(INGREDIENT, ingredient_id)
+            self._load_ingredients(Ingredient.objects.filter(id__in=dirty))
+        if self._dirty_recipes:
+            dirty, self._dirty_recipes = self._dirty_recipes, set()
+            for recipe_id in dirty:
+                self._remove_entry(RECIPE, recipe_id)
+                self._count_source(self._recipe_sources.pop(recipe_id, None), -1)
+            self._load_recipes(Recipe.objects.filter(id__in=dirty))
+
+    def complete(self, prefix, limit=10):
+        '''
+        The best weighted ingredient names, recipe names and sources that have a word starting
+        with prefix, as a dict of kind to labels.
+        '''
+        prefix = normalize(prefix)
+        results = {INGREDIENT: [], RECIPE: [], SOURCE: []}
+        if not prefix:
+            return results
+
+        short = len(prefix) <= SHORT_PREFIX and limit <= TOP_COMPLETIONS
+        with self._lock:
+            self._refresh()
+            top = self._top.get(prefix) if short else None
+            if top is None:
+                matches = self._matches(prefix, None if short else MAX_SCAN)
+                if short:
+                    top = self._top[prefix] = _rank(matches, TOP_COMPLETIONS)
+
+        if top is None:
+            top = _rank(matches, limit)
+        for kind in results:
+            results[kind] = [label for _, _, label in top[kind][:limit]]
+        return results
+
+    def _matches(self, prefix, max_scan):
+        matches = {}
+        start = bisect_left(self._keys, (prefix,))
+        end = len(self._keys) if max_scan is None else min(start + max_scan, len(self._keys))
+        for index in range(start, end):
+            key, kind, entity = self._keys[index]
+            if not key.startswith(prefix):
+                break
+            label, weight, _, normalized = self._entries[(kind, entity)]
+            # labels that start with the prefix beat ones that only have a word that does
+            matches[(kind, entity)] = (normalized.startswith(prefix), weight, label)
+        return matches
+
+
+def _rank(matches, limit):
+    return {kind: heapq.nlargest(limit, (match for (match_kind, _), match in matches.items()
+                                         if match_kind == kind))
+            for kind in KINDS}
+
+
+autocomplete_index = AutocompleteIndex()
+
+
+def _recipe_changed(sender, instance, **kwargs):
+    autocomplete_index.mark_recipes_dirty([instance.id])
+
+
+def _recipe_ingredient_changed(sender, instance, **kwargs):
+    autocomplete_index.mark_ingredients_dirty([instance.ingredient_id])
+
+
+def _ingredient_changed(sender, instance, **kwargs):
+    autocomplete_index.mark_ingredients_dirty([instance.id])
+
+
+def _ingredients_updated(sender, ingredient_ids, **kwargs):
+    autocomplete_index.mark_ingredients_dirty(ingredient_ids)
+
+
+def _search_documents_updated(sender, recipe_ids, **kwargs):
+    autocomplete_index.mark_recipes_dirty(recipe_ids)
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+
+    from api.models import RecipeIngredient
+    from api.signals import ingredients_updated, search_documents_updated
+
+    for signal in (post_save, post_delete):
+        signal.connect(_recipe_changed, sender=Recipe)
+        signal.connect(_recipe_ingredient_changed, sender=RecipeIngredient)
+        signal.connect(_ingredient_changed, sender=Ingredient)
+    ingredients_updated.connect(_ingredients_updated)
+    search_documents_updated.connect(_search_documents_updated)
@@ -0,0 +1,170 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+from api.models import DataVersion
+from api.search import parse_search_term, RELEVANCE, SORTABLE_FIELDS
+
+DATA_VERSION_KEY = 'data_version'
+# every pantry's version, bumped when ingredient names or categories change
+PANTRIES_VERSION_KEY = 'pantry_version'
+PANTRY_VERSION_KEY = 'pantry_version:{}'
+
+
+def _cache():
+    return caches['search']
+
+
+def _versions(*keys):
+    # one query for all of them, a missing version (first use) starts a new one
+    versions = dict(DataVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        DataVersion.objects.bulk_create(
+            [DataVersion(key=key, version=time.time_ns()) for key in missing],
+            ignore_conflicts=True)
+        versions.update(DataVersion.objects.filter(key__in=missing)
+                        .values_list('key', 'version'))
+    return tuple(versions[key] for key in keys)
+
+
+def _bump(keys):
+    version = time.time_ns()
+    updated = set(DataVersion.objects.filter(key__in=keys).values_list('key', flat=True))
+    DataVersion.objects.filter(key__in=updated).update(version=version)
+    DataVersion.objects.bulk_create(
+        [DataVersion(key=key, version=version) for key in keys if key not in updated],
+        ignore_conflicts=True)
+
+
+def data_version():
+    '''
+    A token that changes whenever a recipe, ingredient or pantry write commits, in any process.
+    Cached results are keyed by it, so a bump invalidates all of them at once and the stale
+    entries simply age out.
+    '''
+    return _versions(DATA_VERSION_KEY)[0]
+
+
+def bump_data_version():
+    _bump([DATA_VERSION_KEY])
+
+
+def bump_data_version_on_commit(*args, **kwargs):
+    '''Signal receiver: bumps the version once the current transaction (if any) commits.'''
+    transaction.on_commit(bump_data_version)
+
+
+def pantry_version(pantry_id):
+    '''A token that changes whenever what the pantry has in stock (or satisfies) changes.'''
+    return _versions(PANTRIES_VERSION_KEY, PANTRY_VERSION_KEY.format(pantry_id))
+
+
+def bump_pantry_versions(pantry_ids=None):
+    '''Bumps the versions of the given pantries (every pantry when None) once committed.'''
+    if pantry_ids is None:
+        keys = [PANTRIES_VERSION_KEY]
+    else:
+        keys = [PANTRY_VERSION_KEY.format(pantry_id) for pantry_id in pantry_ids]
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def _pantry_ingredient_changed(sender, instance, **kwargs):
+    bump_pantry_versions([instance.pantry_id])
+
+
+def _pantry_updated(sender, pantry_ids, **kwargs):
+    bump_pantry_versions(pantry_ids)
+
+
+def _names_changed(*args, **kwargs):
+    bump_pantry_versions()
+
+
+def search_key(search_term, allowances, shortlist, today, partner_likes, fuzzy=False):
+    '''
+    The filters of a recipe search in a normal form, so that equivalent searches share a cache
+    entry.  None when the search term can not be parsed.
+    '''
+    parsed = parse_search_term(search_term)
+    if parsed is None:
+        return None
+    return (
+        tuple(term.lower() for term in parsed.terms),
+        tuple(sorted(' '.join(phrase.lower().split()) for phrase in parsed.phrases)),
+        -1 if allowances == -1 else allowances or 0,
+        bool(shortlist),
+        bool(today),
+        bool(partner_likes),
+        bool(fuzzy),
+    )
+
+
+def sort_key(sorted_by, desc):
+    if sorted_by == RELEVANCE:
+        return sorted_by, True
+    if sorted_by not in SORTABLE_FIELDS:
+        return None, False
+    return sorted_by, bool(desc)
+
+
+class SearchResultCache(object):
+    '''
+    Ordered recipe ids per (search, sort) and the total per search, in the 'search' cache
+    (least recently used entries are culled once it holds MAX_ENTRIES).  The ids may be only
+    the first of the results, as far as pages have been read.  The total does not depend on
+    the sort, so the count of a search is shared by every ordering of its results.
+
+    Callers read data_version() before running a search and store the result under that
+    version, so a write that commits while the search runs leaves the result unreachable.
+    '''
+
+    @staticmethod
+    def _key(kind, version, *parts):
+        digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+        return f'{kind}:{version}:{digest}'
+
+    def get_ids(self, version, search, sort):
+        '''The cached ids and whether they are every result rather than the first ones.'''
+        return _cache().get(self._key('ids', version, search, sort), (None, False))
+
+    def get_total(self, version, search):
+        return _cache().get(self._key('total', version, search))
+
+    def set_ids(self, version, search, sort, ids, complete=True):
+        values = {self._key('ids', version, search, sort): (ids, complete)}
+        if complete:
+            values[self._key('total', version, search)] = len(ids)
+        _cache().set_many(values, timeout=None)
+
+    def set_total(self, version, search, total):
+        _cache().set(self._key('total', version, search), total, timeout=None)
+
+
+search_cache = SearchResultCache()
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+
+    from api.models import Recipe, RecipeIngredient, Ingredient, IngredientToIngredient, \
+        Pantry, PantryIngredient
+    from api.signals import search_documents_updated, ingredients_updated, pantry_updated, \
+        categories_updated
+
+    for signal in (post_save, post_delete):
+        for model in (Recipe, RecipeIngredient, Ingredient, IngredientToIngredient, Pantry,
+                      PantryIngredient):
+            signal.connect(bump_data_version_on_commit, sender=model)
+    for signal in (search_documents_updated, ingredients_updated, pantry_updated,
+                   categories_updated):
+        signal.connect(bump_data_version_on_commit)
+
+    for signal in (post_save, post_delete):
+        signal.connect(_pantry_ingredient_changed, sender=PantryIngredient)
+        signal.connect(_names_changed, sender=Pantry)
+    pantry_updated.connect(_pantry_updated)
+    ingredients_updated.connect(_names_changed)
+    categories_updated.connect(_names_changed)
@@ -0,0 +1,89 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from api.models import Ingredient, IngredientClosure, IngredientToIngredient
+from api.signals import categories_updated
+
+
+def category_parents(edges):
+    '''The parent ids of each ingredient id, from (child id, parent id) pairs.'''
+    parents = defaultdict(set)
+    for child_id, parent_id in edges:
+        parents[child_id].add(parent_id)
+    return parents
+
+
+def ancestor_depths(ingredient_id, parents):
+    '''Every category above an ingredient and its depth, breadth first so depths are shortest.'''
+    depths, frontier, depth = {}, [ingredient_id], 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for current in frontier:
+            for parent_id in parents.get(current, ()):
+                # a category graph with a cycle must not loop forever
+                if parent_id not in depths and parent_id != ingredient_id:
+                    depths[parent_id] = depth
+                    next_frontier.append(parent_id)
+        frontier = next_frontier
+    return depths
+
+
+def _below(ingredient_ids, parents):
+    children = defaultdict(set)
+    for child_id, parent_ids in parents.items():
+        for parent_id in parent_ids:
+            children[parent_id].add(child_id)
+
+    found, frontier = set(ingredient_ids), list(ingredient_ids)
+    while frontier:
+        current = frontier.pop()
+        for child_id in children.get(current, set()) - found:
+            found.add(child_id)
+            frontier.append(child_id)
+    return found
+
+
+def update_closure(ingredient_ids=None):
+    '''
+    Rebuilds the closure rows of the given ingredients and of everything categorised under them,
+    which are the only rows a change to their categories can affect (every row when None).
+    Returns the ids of the categories that were gained or lost, which categories_updated is
+    sent with.
+    '''
+    parents = category_parents(
+        IngredientToIngredient.objects.values_list('child_id', 'parent_id'))
+    closure = IngredientClosure.objects.all()
+    if ingredient_ids is None:
+        descendants = set(parents) | set(closure.values_list('descendant_id', flat=True))
+    else:
+        descendants = _below(ingredient_ids, parents)
+        closure = closure.filter(descendant_id__in=descendants)
+
+    old = set(closure.values_list('ancestor_id', 'descendant_id', 'depth'))
+    new = {(ancestor_id, descendant_id, depth)
+           for descendant_id in descendants
+           for ancestor_id, depth in ancestor_depths(descendant_id, parents).items()}
+    if old == new:
+        return []
+
+    with transaction.atomic():
+        closure.delete()
+        IngredientClosure.objects.bulk_create([
+            IngredientClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+            for ancestor_id, descendant_id, depth in sorted(new)
+        ], batch_size=1000)
+
+    changed = sorted({ancestor_id for ancestor_id, _, _ in old ^ new})
+    categories_updated.send(sender=Ingredient, ingredient_ids=changed)
+    return changed
+
+
+def category_names(ingredients):
+    '''
+    Names of every category above the given ingredients (a queryset of ingredient ids), as a
+    subquery: a recipe asking for one of them is satisfied by the ingredient.
+    '''
+    return IngredientClosure.objects.filter(descendant_id__in=ingredients)\
+        .values('ancestor__name')
@@ -0,0 +1,176 @@
+import logging
+from functools import partial
+
+from django.conf import settings
+from graphql import GraphQLError
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult
+from graphql.execution.values import get_variable_values
+from graphql.language import ast
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type
+from graphql.utils.value_from_ast import value_from_ast
+
+logger = logging.getLogger(__name__)
+
+# what each row a field resolves to costs (1 for objects, 0 for scalars otherwise), for the
+# fields that run queries of their own
+FIELD_COSTS = {
+    ('Query', 'searchedRecipesCount'): 10,
+    ('Query', 'getFilteredIngredientsCount'): 10,
+    ('Query', 'nextPurchases'): 5,
+    ('Query', 'shoppingList'): 2,
+    ('RecipeConnection', 'totalCount'): 10,
+    ('RecipeConnection', 'facets'): 10,
+}
+
+# how many rows lists without a first or limit argument are taken to have
+LIST_SIZES = {
+    ('Query', 'allIngredients'): 500,
+    ('Query', 'allIngredientsNotGarnish'): 500,
+    ('Query', 'usersRecipes'): 200,
+    ('Query', 'usersPantry'): 200,
+    ('RecipeType', 'ingredients'): 10,
+    ('RecipeType', 'recipeingredientSet'): 10,
+    ('IngredientType', 'categories'): 3,
+}
+DEFAULT_LIST_SIZE = 20
+
+# the arguments that bound the rows of a list or connection
+SIZE_ARGUMENTS = ('first', 'limit')
+# the arguments that skip rows, which are still read (and cached) to get past them, so each
+# costs what the field does for a row without its selections
+OFFSET_ARGUMENTS = ('page',)
+
+
+def _is_list(field_type):
+    while isinstance(field_type, GraphQLNonNull):
+        field_type = field_type.of_type
+    return isinstance(field_type, GraphQLList)
+
+
+def _argument_rows(field_def, field_ast, variables, names):
+    for argument in field_ast.arguments or ():
+        name = argument.name.value
+        if name in names and name in field_def.args:
+            size = value_from_ast(argument.value, field_def.args[name].type, variables)
+            if size is not None:
+                return max(size, 0)
+    return None
+
+
+class _Analysis(object):
+    def __init__(self, schema, fragments, variables):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+
+    def selection_set_cost(self, parent_type, selection_set, seen=frozenset()):
+        cost = 0
+        for selection in selection_set.selections if selection_set else ():
+            if isinstance(selection, ast.Field):
+                cost += self.field_cost(parent_type, selection, seen)
+            elif isinstance(selection, ast.InlineFragment):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                cost += self.selection_set_cost(fragment_type, selection.selection_set, seen)
+            elif isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                # cycles and unknown fragments are left to validation
+                if fragment is not None and name not in seen:
+                    cost += self.selection_set_cost(
+                        self.schema.get_type(fragment.type_condition.name.value),
+                        fragment.selection_set, seen | {name})
+        return cost
+
+    def field_cost(self, parent_type, field_ast, seen):
+        name = field_ast.name.value
+        fields = getattr(parent_type, 'fields', None)
+        if name.startswith('__') or not fields or name not in fields:
+            return 0
+        field_def = fields[name]
+        field_type = get_named_type(field_def.type)
+
+        size = _argument_rows(field_def, field_ast, self.variables, SIZE_ARGUMENTS)
+        skipped = _argument_rows(field_def, field_ast, self.variables, OFFSET_ARGUMENTS) or 0
+        if size is None and _is_list(field_def.type) and name != 'edges':
+            # the edges of a connection are as many as its first
+            size = LIST_SIZES.get((parent_type.name, name), DEFAULT_LIST_SIZE)
+        own = FIELD_COSTS.get((parent_type.name, name), 1 if hasattr(field_type, 'fields') else 0)
+        children = self.selection_set_cost(field_type, field_ast.selection_set, seen)
+        return (own + children) * (1 if size is None else size) + own * skipped
+
+
+def query_cost(schema, document_ast, variables=None, operation_name=None):
+    '''
+    The cost of running an operation of the document, worked out from the document alone
+    before anything runs: every object a field resolves to costs 1 (or its FIELD_COSTS), times
+    the rows of the lists it is in, which are their first or limit argument or else LIST_SIZES,
+    plus its own cost for each row a page argument skips.
+    Without an operation name the most expensive operation is counted.  Raises GraphQLError
+    when the variables don't fit the operation.
+    '''
+    fragments, operations = {}, []
+    for definition in document_ast.definitions:
+        if isinstance(definition, ast.FragmentDefinition):
+            fragments[definition.name.value] = definition
+        elif isinstance(definition, ast.OperationDefinition):
+            if operation_name is None or getattr(definition.name, 'value', None) == operation_name:
+                operations.append(definition)
+
+    costs = [0]
+    for operation in operations:
+        root_type = {
+            'query': schema.get_query_type(),
+            'mutation': schema.get_mutation_type(),
+            'subscription': schema.get_subscription_type(),
+        }.get(operation.operation)
+        if root_type is not None:
+            # coerced as execute does, so that sizes given as variables are counted as such
+            try:
+                coerced = get_variable_values(schema, operation.variable_definitions or [],
+                                              variables)
+            except (TypeError, ValueError, AttributeError) as e:
+                raise GraphQLError(f'Invalid variables: {e}', [operation])
+            analysis = _Analysis(schema, fragments, coerced)
+            costs.append(analysis.selection_set_cost(root_type, operation.selection_set))
+    return max(costs)
+
+
+def execute_within_budget(execute, schema, document_ast, *args, **kwargs):
+    '''
+    Runs the document with execute unless its query_cost is over GRAPHQL_COST_LIMIT, and reports
+    the cost in the extensions of the result.  Documents whose cost can't be worked out, their
+    variables not fitting or otherwise, are rejected without running.
+    '''
+    budget = settings.GRAPHQL_COST_LIMIT
+    extensions = {'cost': {'requested': None, 'limit': budget}}
+    try:
+        cost = query_cost(schema, document_ast, kwargs.get('variables'),
+                          kwargs.get('operation_name'))
+    except GraphQLError as e:
+        return ExecutionResult(errors=[e], invalid=True, extensions=extensions)
+    except Exception:
+        logger.exception('could not work out the query cost')
+        return ExecutionResult(errors=[GraphQLError('Could not work out the cost of the query')],
+                               invalid=True, extensions=extensions)
+    extensions['cost']['requested'] = cost
+    if budget is not None and cost > budget:
+        return ExecutionResult(errors=[GraphQLError(
+            f'Query cost {cost} is over the limit of {budget}, ask for fewer rows or fields')],
+            invalid=True, extensions=extensions)
+
+    result = execute(*args, **kwargs)
+    result.extensions.update(extensions)
+    return result
+
+
+class CostLimitBackend(GraphQLCoreBackend):
+    '''The default graphql-core backend, with execute_within_budget in front of execution.'''
+
+    def document_from_string(self, schema, document_string):
+        document = super().document_from_string(schema, document_string)
+        document.execute = partial(execute_within_budget, document.execute, schema,
+                                   document.document_ast)
+        return document
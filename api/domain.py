@@ -11,11 +11,17 @@ import nltk
 from django.contrib.auth.models import User
 
 from django.core.validators import URLValidator
+from django.db import transaction
+from django.db.models import Q
 from django.core.exceptions import ValidationError
 from recipe_scrapers import scrape_me
 
 from api.general.core import Ingreedy, replacement_mapper
-from api.models import Recipe, Ingredient, RecipeIngredient, PantryIngredient
+from api.categories import update_closure
+from api.models import Recipe, Ingredient, RecipeIngredient, PantryIngredient, Pantry, \
+    IngredientToIngredient
+from api.search import update_search_documents
+from api.signals import ingredients_updated, pantry_updated
 from api.validators import RecipeValidator
 
 
@@ -665,8 +671,43 @@ def merge_ingredients_and_update_models(_id, name):
     ingredient_to_remove = Ingredient.objects.get(id=_id)
     recipe_ingredients_to_change = RecipeIngredient.objects.filter(ingredient=ingredient_to_remove)
     pantry_ingredients_to_change = PantryIngredient.objects.filter(ingredient=ingredient_to_remove)
+    recipe_ids = list(recipe_ingredients_to_change.values_list('beverage_id', flat=True))
+
+    # the removed ingredient's categories and the ingredients under it move to existing
+    links = IngredientToIngredient.objects.filter(
+        Q(child=ingredient_to_remove) | Q(parent=ingredient_to_remove))
+    moved = {(existing.id if child_id == ingredient_to_remove.id else child_id,
+              existing.id if parent_id == ingredient_to_remove.id else parent_id)
+             for child_id, parent_id in links.values_list('child_id', 'parent_id')}
+    moved -= set(IngredientToIngredient.objects.filter(
+        Q(child=existing) | Q(parent=existing)).values_list('child_id', 'parent_id'))
 
     recipe_count = recipe_ingredients_to_change.update(ingredient=existing)
     pantry_count = pantry_ingredients_to_change.update(ingredient=existing)
     print(f'updated {recipe_count} recipe ingredients and {pantry_count} pantry ingredients')
+    IngredientToIngredient.objects.bulk_create([
+        IngredientToIngredient(child_id=child_id, parent_id=parent_id)
+        for child_id, parent_id in sorted(moved) if child_id != parent_id])
     ingredient_to_remove.delete()
+    # existing and everything under it, which now includes what was under the removed one
+    update_closure([existing.id])
+    update_search_documents(recipe_ids)
+    ingredients_updated.send(sender=Ingredient, ingredient_ids=[existing.id])
+
+
+def set_stock(pantry_ingredients, in_stock):
+    '''
+    Sets the stock of a queryset of pantry ingredients with one UPDATE, and lets the pantry
+    statuses and search cache catch up once for the whole batch.  Returns the ids of the pantry
+    ingredients that changed.
+    '''
+    with transaction.atomic():
+        changed = list(pantry_ingredients.exclude(in_stock=in_stock).select_for_update()
+                       .order_by('id').values_list('id', 'pantry_id', 'ingredient_id'))
+        ids = [pantry_ingredient_id for pantry_ingredient_id, _, _ in changed]
+        if ids:
+            PantryIngredient.objects.filter(id__in=ids).update(in_stock=in_stock)
+            pantry_updated.send(sender=Pantry,
+                                pantry_ids=sorted({pantry_id for _, pantry_id, _ in changed}),
+                                ingredient_ids=sorted({i for _, _, i in changed}))
+    return ids
@@ -0,0 +1,117 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+
+from api.makeability import missing_ingredients
+from api.models import Ingredient, IngredientStats, RecipeIngredient
+from api.pantry_status import recipes_using
+
+
+def mark_stale(recipe_ids=None):
+    '''Marks the stats of every ingredient the given recipes use (all when None) for a refresh.'''
+    stats = IngredientStats.objects.filter(stale=False)
+    if recipe_ids is not None:
+        stats = stats.filter(ingredient__name__in=RecipeIngredient.objects.filter(
+            beverage_id__in=recipe_ids).values('ingredient__name'))
+    return stats.update(stale=True)
+
+
+def refresh_stats(ingredient_ids):
+    '''Recomputes the stats of the given ingredients from the recipes using their names.'''
+    ingredients = list(Ingredient.objects.filter(id__in=ingredient_ids)
+                       .values_list('id', 'name', 'owner_id'))
+    uses = RecipeIngredient.objects\
+        .filter(ingredient__name__in={name for _, name, _ in ingredients})\
+        .values_list('ingredient__name', 'beverage_id', 'beverage__date_modified')
+    recipes, last_used = defaultdict(set), {}
+    for name, recipe_id, date_modified in uses:
+        recipes[name].add(recipe_id)
+        if date_modified and (name not in last_used or date_modified > last_used[name]):
+            last_used[name] = date_modified
+
+    # what each owner's pantry is missing of the recipes, in one batch per owner
+    missing = {}
+    for owner in User.objects.filter(id__in={owner_id for _, _, owner_id in ingredients}):
+        used = {recipe_id for _, name, owner_id in ingredients if owner_id == owner.id
+                for recipe_id in recipes[name]}
+        missing[owner.id] = missing_ingredients(sorted(used), owner)
+
+    existing = IngredientStats.objects.in_bulk([ingredient_id for ingredient_id, _, _ in ingredients])
+    changed, added = [], []
+    for ingredient_id, name, owner_id in ingredients:
+        owner_missing = missing.get(owner_id, {})
+        stats = existing.get(ingredient_id) or IngredientStats(ingredient_id=ingredient_id)
+        stats.recipe_count = len(recipes[name])
+        stats.makeable_count = sum(1 for recipe_id in recipes[name]
+                                   if not owner_missing.get(recipe_id))
+        stats.blocking_count = sum(1 for recipe_id in recipes[name]
+                                   if [i.name for i in owner_missing.get(recipe_id, ())] == [name])
+        stats.last_used = last_used.get(name)
+        stats.stale = False
+        (changed if ingredient_id in existing else added).append(stats)
+
+    IngredientStats.objects.bulk_update(
+        changed, ['recipe_count', 'makeable_count', 'blocking_count', 'last_used', 'stale'],
+        batch_size=1000)
+    IngredientStats.objects.bulk_create(added, batch_size=1000, ignore_conflicts=True)
+
+
+def refresh_stale_stats(ingredient_ids=None):
+    '''
+    Refreshes the stats of the given ingredients (all of them when None) that are stale or
+    have none yet, so they can be read or sorted on directly.
+    '''
+    ingredients = Ingredient.objects.exclude(stats__stale=False)
+    if ingredient_ids is not None:
+        ingredients = ingredients.filter(id__in=ingredient_ids)
+    stale = list(ingredients.values_list('id', flat=True))
+    if stale:
+        refresh_stats(stale)
+    return stale
+
+
+def _recipe_ingredient_deleted(sender, instance, **kwargs):
+    # the recipe no longer counts towards the ingredient, the recipe's others are refreshed by
+    # the search document update that follows recipe writes
+    IngredientStats.objects.filter(
+        stale=False, ingredient__name__in=Ingredient.objects.filter(
+            id=instance.ingredient_id).values('name')).update(stale=True)
+
+
+def _pantry_ingredient_changed(sender, instance, **kwargs):
+    mark_stale(recipes_using([instance.ingredient_id]))
+
+
+def _pantry_saved(sender, instance, created, **kwargs):
+    if created:
+        mark_stale()
+
+
+def _pantry_updated(sender, pantry_ids, ingredient_ids=None, **kwargs):
+    mark_stale(None if ingredient_ids is None else recipes_using(ingredient_ids))
+
+
+def _ingredients_updated(sender, ingredient_ids, **kwargs):
+    IngredientStats.objects.filter(ingredient_id__in=ingredient_ids).update(stale=True)
+    mark_stale(recipes_using(ingredient_ids))
+
+
+def _search_documents_updated(sender, recipe_ids, **kwargs):
+    mark_stale(recipe_ids)
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+
+    from api.models import Pantry, PantryIngredient
+    from api.signals import categories_updated, ingredients_updated, pantry_updated, \
+        search_documents_updated
+
+    post_delete.connect(_recipe_ingredient_deleted, sender=RecipeIngredient)
+    post_save.connect(_pantry_ingredient_changed, sender=PantryIngredient)
+    post_delete.connect(_pantry_ingredient_changed, sender=PantryIngredient)
+    post_save.connect(_pantry_saved, sender=Pantry)
+    pantry_updated.connect(_pantry_updated)
+    ingredients_updated.connect(_ingredients_updated)
+    categories_updated.connect(_ingredients_updated)
+    search_documents_updated.connect(_search_documents_updated)
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.domain import create_recipe_from_url, save_recipe_from_parsed_recipes
+from api.models import ImportJob, Recipe
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.URL_IMPORT_WORKERS,
+                                           thread_name_prefix='url-import')
+        return _executor
+
+
+def enqueue_url_import(url):
+    '''
+    The import job for url, queued to run on the import worker threads if the url has not been
+    imported yet.  Jobs are deduplicated by url: a pending, running or finished job is returned
+    as it is, and only a failed one is queued again.
+    '''
+    job, created = ImportJob.objects.get_or_create(url=url)
+    if not created:
+        if job.status != ImportJob.FAILED:
+            return job
+        # only one of several concurrent retries gets to flip the job back to pending
+        retried = ImportJob.objects.filter(id=job.id, status=ImportJob.FAILED)\
+            .update(status=ImportJob.PENDING, error=None, updated=timezone.now())
+        job.refresh_from_db()
+        if not retried:
+            return job
+
+    job_id = job.id
+    transaction.on_commit(lambda: _get_executor().submit(run_import_job, job_id))
+    return job
+
+
+def run_import_job(job_id):
+    '''Scrapes and saves the recipe of a pending job, recording the outcome on the job.'''
+    try:
+        if not ImportJob.objects.filter(id=job_id, status=ImportJob.PENDING)\
+                .update(status=ImportJob.RUNNING, updated=timezone.now()):
+            return
+        job = ImportJob.objects.get(id=job_id)
+        print(f'importing recipe from {job.url}')
+        try:
+            recipe_id = save_recipe_from_parsed_recipes(create_recipe_from_url(job.url))
+        except Exception as e:
+            print(f'import of {job.url} failed: {e!r}')
+            ImportJob.objects.filter(id=job_id).update(
+                status=ImportJob.FAILED, error=repr(e), updated=timezone.now())
+            return
+
+        if recipe_id is None:
+            # a duplicate of a recipe that is already saved
+            recipe_id = Recipe.objects.filter(source_url=job.url)\
+                .values_list('id', flat=True).first()
+        ImportJob.objects.filter(id=job_id).update(
+            status=ImportJob.DONE, recipe_id=recipe_id, updated=timezone.now())
+    finally:
+        # worker threads open their own connection, don't leave it behind
+        connection.close()
@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from api.ingredient_stats import refresh_stale_stats
+from api.models import Ingredient, IngredientStats, IngredientToIngredient
+
+
+class IngredientLoader(DataLoader):
+    '''Ingredients by id (None for ids that don't exist), one query per resolution pass.'''
+
+    def batch_load_fn(self, ingredient_ids):
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        return Promise.resolve([ingredients.get(ingredient_id) for ingredient_id in ingredient_ids])
+
+
+class IngredientStatsLoader(DataLoader):
+    '''The up to date stats of each ingredient id, the stale ones refreshed together first.'''
+
+    def batch_load_fn(self, ingredient_ids):
+        refresh_stale_stats(ingredient_ids)
+        stats = IngredientStats.objects.in_bulk(ingredient_ids)
+        return Promise.resolve([stats.get(ingredient_id) for ingredient_id in ingredient_ids])
+
+
+class _CategoryLoader(DataLoader):
+    # the ingredients on the far side of each link are primed into the ingredient loader, so
+    # walking on from them doesn't load them again
+    key_field = None
+    other_field = None
+
+    def __init__(self, ingredients, **kwargs):
+        super().__init__(**kwargs)
+        self.ingredients = ingredients
+
+    def batch_load_fn(self, ingredient_ids):
+        links = IngredientToIngredient.objects\
+            .filter(**{f'{self.key_field}_id__in': ingredient_ids})\
+            .select_related(self.other_field).order_by('id')
+        found = defaultdict(list)
+        for link in links:
+            other = getattr(link, self.other_field)
+            found[getattr(link, f'{self.key_field}_id')].append(other)
+            self.ingredients.prime(other.id, other)
+        return Promise.resolve([found[ingredient_id] for ingredient_id in ingredient_ids])
+
+
+class ParentsLoader(_CategoryLoader):
+    '''The categories directly above each ingredient id.'''
+    key_field = 'child'
+    other_field = 'parent'
+
+
+class ChildrenLoader(_CategoryLoader):
+    '''The ingredients directly under each category id.'''
+    key_field = 'parent'
+    other_field = 'child'
+
+
+class Loaders(object):
+    def __init__(self):
+        self.ingredients = IngredientLoader()
+        self.parents = ParentsLoader(self.ingredients)
+        self.children = ChildrenLoader(self.ingredients)
+        self.stats = IngredientStatsLoader()
+
+
+def loaders(info):
+    '''
+    The loaders of the request being resolved, made on its first use so that nothing cached
+    outlives the request.
+    '''
+    context = info.context
+    if context is None:
+        return Loaders()
+    request_loaders = getattr(context, 'loaders', None)
+    if request_loaders is None:
+        request_loaders = context.loaders = Loaders()
+    return request_loaders
@@ -0,0 +1,471 @@
+import threading
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Q, Subquery
+
+from api.cache import pantry_version
+from api.categories import category_names
+from api.models import Recipe, RecipeIngredient, PantryIngredient, Pantry, Ingredient, \
+    PantryRecipeStatus
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0f0f0f0f0f0f0f0f)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def _popcount(words):
+    '''Set bits of each uint64 word, with the usual shift and mask (SWAR) steps.'''
+    words = words - ((words >> np.uint64(1)) & _M1)
+    words = (words & _M2) + ((words >> np.uint64(2)) & _M2)
+    words = (words + (words >> np.uint64(4))) & _M4
+    return (words * _H01) >> np.uint64(56)
+
+
+def _word_and_bit(bit):
+    return bit >> 6, np.uint64(1) << np.uint64(bit & 63)
+
+
+class MakeabilityIndex(object):
+    '''
+    Every ingredient name gets a dense bit position and every recipe a row of packed bits
+    (numpy uint64 words) for the non garnish ingredients it needs.  How many ingredients each
+    recipe is missing from a pantry is then popcount(recipe & ~pantry), computed for all recipes
+    at once.
+
+    Ingredients are matched by name, as pantries may hold another owner's ingredient of the same
+    name.  Like the search index it is built on first use and recipes marked dirty from model
+    signals are reloaded by the next lookup.
+    '''
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._bits = {}
+        self._masks = np.zeros((0, 0), dtype=np.uint64)
+        self._row_recipes = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows = {}
+        self._count = 0
+        self._recipe_ingredients = {}
+        # every ingredient of each recipe, garnishes too, as turning one into a garnish (or back)
+        # changes the recipes using it
+        self._recipe_ingredient_ids = {}
+        self._ingredient_recipes = defaultdict(set)
+        self._dirty = set()
+        self._generation = 0
+
+    @staticmethod
+    def _load(recipe_ids=None):
+        recipe_ingredients = RecipeIngredient.objects.values_list(
+            'beverage_id', 'ingredient_id', 'ingredient__name', 'ingredient__is_garnish')\
+            .order_by('id')
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipe_ingredients = recipe_ingredients.filter(beverage_id__in=recipe_ids)
+            recipes = recipes.filter(id__in=recipe_ids)
+
+        loaded = {recipe_id: [] for recipe_id in recipes.values_list('id', flat=True)}
+        for recipe_id, ingredient_id, name, is_garnish in recipe_ingredients:
+            if recipe_id in loaded:
+                loaded[recipe_id].append((ingredient_id, name, is_garnish))
+        return loaded
+
+    def build(self):
+        with self._lock:
+            self._bits = {}
+            self._masks = np.zeros((0, 0), dtype=np.uint64)
+            self._row_recipes = np.zeros(0, dtype=np.int64)
+            self._alive = np.zeros(0, dtype=bool)
+            self._rows = {}
+            self._count = 0
+            self._recipe_ingredients = {}
+            self._recipe_ingredient_ids = {}
+            self._ingredient_recipes = defaultdict(set)
+            self._dirty = set()
+            for recipe_id, ingredients in sorted(self._load().items()):
+                self._set(recipe_id, ingredients)
+            self._generation += 1
+            self._built = True
+
+    def mark_dirty(self, recipe_ids=None):
+        with self._lock:
+            if not self._built:
+                return
+            if recipe_ids is None:
+                self._built = False
+            else:
+                self._dirty.update(recipe_ids)
+
+    def mark_ingredients_dirty(self, ingredient_ids):
+        with self._lock:
+            for ingredient_id in ingredient_ids:
+                self.mark_dirty(self._ingredient_recipes.get(ingredient_id, ()))
+
+    def _bit(self, name):
+        bit = self._bits.get(name)
+        if bit is None:
+            bit = self._bits[name] = len(self._bits)
+        return bit
+
+    def _grow(self, rows, width):
+        # capacity doubles, so adding recipes and ingredients one at a time stays cheap
+        capacity, current_width = self._masks.shape
+        if rows <= capacity and width <= current_width:
+            return
+        new_capacity = max(rows, capacity * 2 if rows > capacity else capacity, 16)
+        new_width = max(width, current_width * 2 if width > current_width else current_width, 1)
+        masks = np.zeros((new_capacity, new_width), dtype=np.uint64)
+        masks[:capacity, :current_width] = self._masks
+        self._masks = masks
+        self._row_recipes = np.resize(self._row_recipes, new_capacity)
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _set(self, recipe_id, ingredients):
+        needed = [(ingredient_id, self._bit(name))
+                  for ingredient_id, name, is_garnish in ingredients if not is_garnish]
+        row = self._rows.get(recipe_id)
+        if row is None:
+            row = self._rows[recipe_id] = self._count
+            self._count += 1
+        self._grow(self._count, (len(self._bits) + 63) // 64)
+
+        self._masks[row] = 0
+        for _, bit in needed:
+            word, mask = _word_and_bit(bit)
+            self._masks[row, word] |= mask
+        self._row_recipes[row] = recipe_id
+        self._alive[row] = True
+        self._recipe_ingredients[recipe_id] = needed
+        ingredient_ids = self._recipe_ingredient_ids[recipe_id] = \
+            {ingredient_id for ingredient_id, _, _ in ingredients}
+        for ingredient_id in ingredient_ids:
+            self._ingredient_recipes[ingredient_id].add(recipe_id)
+
+    def _remove(self, recipe_id):
+        row = self._rows.get(recipe_id)
+        if row is not None:
+            self._alive[row] = False
+        self._recipe_ingredients.pop(recipe_id, None)
+        for ingredient_id in self._recipe_ingredient_ids.pop(recipe_id, ()):
+            recipes = self._ingredient_recipes[ingredient_id]
+            recipes.discard(recipe_id)
+            if not recipes:
+                del self._ingredient_recipes[ingredient_id]
+
+    def _refresh(self):
+        if not self._built:
+            self.build()
+        elif self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            for recipe_id in dirty:
+                self._remove(recipe_id)
+            for recipe_id, ingredients in self._load(dirty).items():
+                self._set(recipe_id, ingredients)
+
+    def layout(self):
+        '''Changes when bits are added or the index is rebuilt, outdating the masks made before.'''
+        with self._lock:
+            self._refresh()
+            return self._generation, len(self._bits)
+
+    def pantry_mask(self, ingredient_names):
+        '''The packed bits of the named (in stock) ingredients.'''
+        with self._lock:
+            self._refresh()
+            pantry_mask = np.zeros(self._masks.shape[1], dtype=np.uint64)
+            for name in ingredient_names:
+                bit = self._bits.get(name)
+                if bit is not None:
+                    word, mask = _word_and_bit(bit)
+                    pantry_mask[word] |= mask
+            return pantry_mask
+
+    def missing_counts(self, pantry_mask):
+        '''Ids of every recipe and how many of their ingredients are not in the pantry.'''
+        with self._lock:
+            self._refresh()
+            missing = self._masks[:self._count].copy()
+            # ingredients added since the pantry mask was made are missing from it
+            width = min(len(pantry_mask), missing.shape[1])
+            missing[:, :width] &= ~pantry_mask[:width]
+            counts = _popcount(missing).sum(axis=1, dtype=np.int64)
+            alive = self._alive[:self._count]
+            return self._row_recipes[:self._count][alive], counts[alive]
+
+    def makeable(self, pantry_mask, allowances=0):
+        '''Ids of the recipes missing at most allowances ingredients from the pantry.'''
+        recipe_ids, counts = self.missing_counts(pantry_mask)
+        return recipe_ids[counts <= allowances].tolist()
+
+    def missing_ingredient_ids(self, recipe_id, pantry_mask):
+        with self._lock:
+            self._refresh()
+            return [ingredient_id
+                    for ingredient_id, bit in self._recipe_ingredients.get(recipe_id, ())
+                    if bit >> 6 >= len(pantry_mask)
+                    or not pantry_mask[bit >> 6] & _word_and_bit(bit)[1]]
+
+    def next_purchases(self, pantry_mask, allowances=0, limit=10, weights=None, greedy=False):
+        '''
+        The bits of the ingredients that would let the most recipes be made within allowances,
+        with their scores and the ids of the recipes each unlocks.  A recipe exactly one
+        ingredient past allowances scores its weight (1 unless weights has its id) for every
+        ingredient it is missing, summed for all ingredients at once as weighted column sums of
+        the unpacked missing bits.  Greedy picks one ingredient at a time, each with the earlier
+        picks counted as bought.
+        '''
+        with self._lock:
+            self._refresh()
+            alive = self._alive[:self._count]
+            missing = self._masks[:self._count][alive]
+            recipe_ids = self._row_recipes[:self._count][alive]
+            bit_count = len(self._bits)
+
+        width = min(len(pantry_mask), missing.shape[1])
+        missing[:, :width] &= ~pantry_mask[:width]
+        counts = _popcount(missing).sum(axis=1, dtype=np.int64)
+        row_weights = np.ones(len(recipe_ids))
+        if weights:
+            row_weights = np.array([weights.get(recipe_id, 1.0) for recipe_id in recipe_ids.tolist()])
+
+        picks = []
+        while len(picks) < limit:
+            near = counts == allowances + 1
+            # the uint64 words as little endian bytes unpack to one column per bit position
+            bits = np.unpackbits(missing[near].view(np.uint8), axis=1, bitorder='little')
+            bits = bits[:, :bit_count]
+            scores = row_weights[near] @ bits
+            unlocks = recipe_ids[near]
+
+            if not greedy:
+                best = np.argsort(-scores, kind='stable')[:limit]
+                return [(bit, float(scores[bit]), unlocks[bits[:, bit] == 1].tolist())
+                        for bit in best.tolist() if scores[bit] > 0]
+
+            bit = int(np.argmax(scores)) if len(scores) else 0
+            if not len(scores) or scores[bit] <= 0:
+                break
+            picks.append((bit, float(scores[bit]), unlocks[bits[:, bit] == 1].tolist()))
+            word, mask = _word_and_bit(bit)
+            counts -= (missing[:, word] & mask) != 0
+            missing[:, word] &= ~mask
+        return picks
+
+    def bit_names(self, bits):
+        with self._lock:
+            names = {bit: name for name, bit in self._bits.items()}
+            return [names[bit] for bit in bits]
+
+
+makeability_index = MakeabilityIndex()
+
+
+def _pantry(user):
+    # the user's first pantry, as a subquery rather than a query of its own
+    return Subquery(Pantry.objects.filter(owner=user).order_by('id').values('id')[:1])
+
+
+def _in_stock(user):
+    return PantryIngredient.objects.filter(pantry=_pantry(user), in_stock=True)
+
+
+class PantrySnapshot(object):
+    '''
+    What a pantry had in stock at one version: the ids of its in stock ingredients, the names
+    they satisfy (their own and every category above them) and, made on first use, those names
+    as a makeability_index mask.  Snapshots are shared between requests and never change, a new
+    version gets a new snapshot.
+    '''
+
+    def __init__(self, pantry_id, version, ingredient_ids, names):
+        self.pantry_id = pantry_id
+        self.version = version
+        self.ingredient_ids = frozenset(ingredient_ids)
+        self.names = frozenset(names)
+        self._mask = (None, None)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def mask(self):
+        layout, mask = self._mask
+        current = makeability_index.layout()
+        if layout != current:
+            mask = makeability_index.pantry_mask(self.names)
+            self._mask = (current, mask)
+        return mask
+
+
+_snapshots = {}
+
+
+def pantry_snapshot(user):
+    '''
+    The snapshot of the user's pantry, reused until a stock change bumps the pantry's version
+    (see api.cache.pantry_version).
+    '''
+    snapshot = _snapshots.get(user.id)
+    if snapshot is not None and snapshot.version == pantry_version(snapshot.pantry_id):
+        return snapshot
+
+    pantry_id = Pantry.objects.filter(owner=user).order_by('id').values_list('id', flat=True)\
+        .first()
+    # read before loading, so a write committing meanwhile outdates what is loaded
+    version = pantry_version(pantry_id)
+    in_stock = list(PantryIngredient.objects.filter(pantry_id=pantry_id, in_stock=True)
+                    .values_list('ingredient_id', 'ingredient__name'))
+    ingredient_ids = [ingredient_id for ingredient_id, _ in in_stock]
+    categories = category_names(ingredient_ids).values_list('ancestor__name', flat=True)
+    snapshot = PantrySnapshot(pantry_id, version, ingredient_ids,
+                              [name for _, name in in_stock] + list(categories))
+    _snapshots[user.id] = snapshot
+    return snapshot
+
+
+def in_stock_names(user):
+    '''
+    Names the user's pantry satisfies: its in stock ingredients and every category above them
+    (Rye Whiskey when Rittenhouse Rye is in stock).
+    '''
+    return pantry_snapshot(user).names
+
+
+def _unsatisfied(in_stock, prefix=''):
+    # neither in stock by name nor a category of something in stock, both anti-joined (NOT IN)
+    # as subqueries
+    return ~Q(**{f'{prefix}ingredient__name__in': in_stock.values('ingredient__name')}) & ~Q(**{
+        f'{prefix}ingredient__name__in': category_names(in_stock.values('ingredient_id'))})
+
+
+def missing_filter(in_stock):
+    '''
+    Matches the non garnish ingredients of a recipe that none of the in_stock pantry ingredients
+    satisfy, by name or as a category above them.
+    '''
+    return Q(recipeingredient__ingredient__is_garnish=False) & _unsatisfied(
+        in_stock, 'recipeingredient__')
+
+
+def missing_count(user):
+    '''How many non garnish ingredients of a recipe are not in stock in the user's pantry.'''
+    return Count('recipeingredient', filter=missing_filter(_in_stock(user)))
+
+
+def filter_makeable(recipes, user, allowances=0):
+    '''
+    Narrows a recipe queryset to the recipes missing at most allowances ingredients from the
+    user's pantry.  With the 'postgres' backend the missing count is annotated and filtered in
+    the same statement as the search, with 'table' it is read from the stored pantry recipe
+    statuses and with 'memory' it comes from makeability_index.
+    '''
+    if settings.PANTRY_FILTER_BACKEND == 'memory':
+        mask = pantry_snapshot(user).mask()
+        return recipes.filter(id__any=makeability_index.makeable(mask, allowances))
+    if settings.PANTRY_FILTER_BACKEND == 'table':
+        return recipes.filter(pantry_statuses__pantry=_pantry(user),
+                              pantry_statuses__missing_count__lte=allowances)
+    return recipes.annotate(missing_count=missing_count(user))\
+        .filter(missing_count__lte=allowances)
+
+
+def _with_ingredients(ingredient_ids):
+    ingredients = Ingredient.objects.in_bulk(
+        {ingredient_id for ids in ingredient_ids.values() for ingredient_id in ids})
+    return {recipe_id: [ingredients[i] for i in ids if i in ingredients]
+            for recipe_id, ids in ingredient_ids.items()}
+
+
+def missing_ingredients(recipe_ids, user):
+    '''The ingredients each recipe is missing from the user's pantry, by recipe id.'''
+    missing = {recipe_id: [] for recipe_id in recipe_ids}
+    if settings.PANTRY_FILTER_BACKEND == 'memory':
+        mask = pantry_snapshot(user).mask()
+        missing.update(_with_ingredients({
+            recipe_id: makeability_index.missing_ingredient_ids(recipe_id, mask)
+            for recipe_id in recipe_ids}))
+        return missing
+    if settings.PANTRY_FILTER_BACKEND == 'table':
+        missing.update(_with_ingredients(dict(
+            PantryRecipeStatus.objects.filter(pantry=_pantry(user), recipe_id__in=recipe_ids)
+            .values_list('recipe_id', 'missing_ingredient_ids'))))
+        return missing
+
+    recipe_ingredients = RecipeIngredient.objects\
+        .filter(_unsatisfied(_in_stock(user)), beverage_id__in=recipe_ids,
+                ingredient__is_garnish=False)\
+        .select_related('ingredient').order_by('id')
+    for recipe_ingredient in recipe_ingredients:
+        missing[recipe_ingredient.beverage_id].append(recipe_ingredient.ingredient)
+    return missing
+
+
+PURCHASE_WEIGHTS = ('rating', 'shortlist', 'partner_likes')
+
+Purchase = namedtuple('Purchase', ('ingredient', 'score', 'recipe_ids'))
+
+
+def next_purchases(user, limit=10, allowances=0, weight_by=None, greedy=False):
+    '''
+    The ingredients missing from the user's pantry that would unlock the most recipes within
+    allowances, best first.  With weight_by each unlocked recipe scores one plus its rating, or
+    two when shortlisted or liked by a partner, rather than one.
+    '''
+    if weight_by is not None and weight_by not in PURCHASE_WEIGHTS:
+        raise Exception(f'weight_by must be one of {", ".join(PURCHASE_WEIGHTS)}')
+    if limit is None or limit < 1:
+        raise Exception('limit must be a positive number')
+
+    weights = None
+    if weight_by:
+        weights = {recipe_id: 1.0 + float(value or 0)
+                   for recipe_id, value in Recipe.objects.values_list('id', weight_by)}
+    mask = pantry_snapshot(user).mask()
+    picks = makeability_index.next_purchases(mask, allowances, limit, weights, greedy)
+    names = makeability_index.bit_names([bit for bit, _, _ in picks])
+
+    # ingredients are matched by name, prefer the user's own of each name
+    ingredients = {}
+    for ingredient in Ingredient.objects.filter(name__in=names).order_by('id'):
+        if ingredient.name not in ingredients or ingredient.owner_id == user.id:
+            ingredients[ingredient.name] = ingredient
+    return [Purchase(ingredients.get(name), score, recipe_ids)
+            for name, (_, score, recipe_ids) in zip(names, picks) if name in ingredients]
+
+
+def _recipe_changed(sender, instance, **kwargs):
+    makeability_index.mark_dirty([instance.id])
+
+
+def _recipe_ingredient_changed(sender, instance, **kwargs):
+    makeability_index.mark_dirty([instance.beverage_id])
+
+
+def _ingredient_changed(sender, instance, **kwargs):
+    makeability_index.mark_ingredients_dirty([instance.id])
+
+
+def _ingredients_updated(sender, ingredient_ids, **kwargs):
+    makeability_index.mark_ingredients_dirty(ingredient_ids)
+
+
+def _search_documents_updated(sender, recipe_ids, **kwargs):
+    makeability_index.mark_dirty(recipe_ids)
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+
+    from api.models import Ingredient
+    from api.signals import ingredients_updated, search_documents_updated
+
+    for signal in (post_save, post_delete):
+        signal.connect(_recipe_changed, sender=Recipe)
+        signal.connect(_recipe_ingredient_changed, sender=RecipeIngredient)
+        signal.connect(_ingredient_changed, sender=Ingredient)
+    ingredients_updated.connect(_ingredients_updated)
+    search_documents_updated.connect(_search_documents_updated)
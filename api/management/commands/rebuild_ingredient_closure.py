@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.categories import update_closure
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the table of every category above each ingredient from IngredientToIngredient'
+
+    def handle(self, *args, **options):
+        changed = update_closure()
+        print(f'rebuilt ingredient closure, {len(changed)} categories changed')
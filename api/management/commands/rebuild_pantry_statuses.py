@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_data_version
+from api.pantry_status import refresh_pantry_statuses
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored missing ingredients of every recipe for every pantry'
+
+    def handle(self, *args, **options):
+        updated = refresh_pantry_statuses()
+        # searches cached by the running server read the statuses
+        bump_data_version()
+        print(f'rebuilt {updated} pantry recipe statuses')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Recipe
+from api.search import update_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored full text search document of every recipe, in batches of ids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            updated += update_search_documents(ids[start:start + batch_size])
+        print(f'rebuilt search documents for {updated} recipes')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.persisted import register_query, PersistedQueryError
+
+
+class Command(BaseCommand):
+    help = 'Registers the GraphQL documents in the given files as persisted queries, which ' \
+           'clients run by the sha256 hash of the file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+
+    def handle(self, *args, **options):
+        from schema import schema
+
+        for path in options['files']:
+            with open(path) as document_file:
+                document = document_file.read()
+            try:
+                sha256 = register_query(schema, document)
+            except PersistedQueryError as e:
+                raise CommandError(f'{path}: {e}')
+            print(f'{sha256} {path}')
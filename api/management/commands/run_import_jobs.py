@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import run_import_job
+from api.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = 'Runs the pending recipe url import jobs, such as those left queued by a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset-running', action='store_true',
+                            help='also rerun jobs left running by a process that stopped')
+
+    def handle(self, *args, **options):
+        if options['reset_running']:
+            ImportJob.objects.filter(status=ImportJob.RUNNING).update(status=ImportJob.PENDING)
+
+        job_ids = list(ImportJob.objects.filter(status=ImportJob.PENDING)
+                       .order_by('id').values_list('id', flat=True))
+        for job_id in job_ids:
+            run_import_job(job_id)
+        print(f'ran {len(job_ids)} import jobs')
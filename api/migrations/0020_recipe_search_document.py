@@ -0,0 +1,33 @@
+# Generated by Django 2.2.5 on 2026-10-18 07:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def load_data(apps, schema_editor):
+    from api.search import search_document_vector
+
+    Recipe = apps.get_model('api', 'Recipe')
+    RecipeIngredient = apps.get_model('api', 'RecipeIngredient')
+
+    Recipe.objects.update(search_document=search_document_vector(RecipeIngredient))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_recipe_partner_likes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='api_recipe_search__85fd98_gin'),
+        ),
+        migrations.RunPython(load_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.5 on 2026-10-18 07:52
+
+import django.contrib.postgres.fields
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def load_data(apps, schema_editor):
+    Pantry = apps.get_model('api', 'Pantry')
+    PantryIngredient = apps.get_model('api', 'PantryIngredient')
+    PantryRecipeStatus = apps.get_model('api', 'PantryRecipeStatus')
+    Recipe = apps.get_model('api', 'Recipe')
+
+    for pantry_id in Pantry.objects.values_list('id', flat=True):
+        in_stock = PantryIngredient.objects.filter(pantry_id=pantry_id, in_stock=True)
+        missing = models.Q(recipeingredient__ingredient__is_garnish=False) & ~models.Q(
+            recipeingredient__ingredient__name__in=in_stock.values('ingredient__name'))
+        statuses = Recipe.objects.annotate(
+            missing=models.Count('recipeingredient', filter=missing),
+            missing_ids=ArrayAgg('recipeingredient__ingredient_id', filter=missing,
+                                 ordering='recipeingredient__id'),
+        ).values_list('id', 'missing', 'missing_ids')
+        PantryRecipeStatus.objects.bulk_create([
+            PantryRecipeStatus(pantry_id=pantry_id, recipe_id=recipe_id, missing_count=count,
+                               missing_ingredient_ids=ingredient_ids)
+            for recipe_id, count, ingredient_ids in statuses
+        ], batch_size=1000)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_import_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantryRecipeStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('missing_count', models.PositiveIntegerField(default=0)),
+                ('missing_ingredient_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('pantry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_statuses', to='api.Pantry')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pantry_statuses', to='api.Recipe')),
+            ],
+            options={
+                'verbose_name_plural': 'pantry recipe statuses',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pantryrecipestatus',
+            index=models.Index(fields=['pantry', 'missing_count'], name='api_pantryr_pantry__ffa078_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pantryrecipestatus',
+            unique_together={('pantry', 'recipe')},
+        ),
+        migrations.RunPython(load_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 2.2.5 on 2026-10-18 07:54
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def load_data(apps, schema_editor):
+    from api.categories import ancestor_depths, category_parents
+
+    IngredientClosure = apps.get_model('api', 'IngredientClosure')
+    IngredientToIngredient = apps.get_model('api', 'IngredientToIngredient')
+    PantryIngredient = apps.get_model('api', 'PantryIngredient')
+    PantryRecipeStatus = apps.get_model('api', 'PantryRecipeStatus')
+    Recipe = apps.get_model('api', 'Recipe')
+
+    parents = category_parents(IngredientToIngredient.objects.values_list('child_id', 'parent_id'))
+    IngredientClosure.objects.bulk_create([
+        IngredientClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+        for descendant_id in parents
+        for ancestor_id, depth in ancestor_depths(descendant_id, parents).items()
+    ], batch_size=1000)
+
+    # pantry statuses now count categories of in stock ingredients as in stock too
+    for pantry_id in PantryRecipeStatus.objects.values_list('pantry_id', flat=True).distinct():
+        in_stock = PantryIngredient.objects.filter(pantry_id=pantry_id, in_stock=True)
+        categories = IngredientClosure.objects.filter(
+            descendant_id__in=in_stock.values('ingredient_id')).values('ancestor__name')
+        missing = models.Q(recipeingredient__ingredient__is_garnish=False) & ~models.Q(
+            recipeingredient__ingredient__name__in=in_stock.values('ingredient__name')) & ~models.Q(
+            recipeingredient__ingredient__name__in=categories)
+        statuses = Recipe.objects.annotate(
+            missing=models.Count('recipeingredient', filter=missing),
+            missing_ids=ArrayAgg('recipeingredient__ingredient_id', filter=missing,
+                                 ordering='recipeingredient__id'),
+        ).values_list('id', 'missing', 'missing_ids')
+        for recipe_id, count, ingredient_ids in statuses:
+            PantryRecipeStatus.objects.filter(pantry_id=pantry_id, recipe_id=recipe_id)\
+                .exclude(missing_count=count, missing_ingredient_ids=ingredient_ids)\
+                .update(missing_count=count, missing_ingredient_ids=ingredient_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_pantry_recipe_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Ingredient')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Ingredient')),
+            ],
+            options={
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(load_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.5 on 2026-10-18 08:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_ingredient_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientStats',
+            fields=[
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.Ingredient')),
+                ('recipe_count', models.PositiveIntegerField(default=0)),
+                ('makeable_count', models.PositiveIntegerField(default=0)),
+                ('blocking_count', models.PositiveIntegerField(default=0)),
+                ('last_used', models.DateTimeField(blank=True, null=True)),
+                ('stale', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name_plural': 'ingredient stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ingredientstats',
+            index=models.Index(fields=['-makeable_count', '-blocking_count', '-recipe_count'], name='api_ingredi_makeabl_bcdc92_idx'),
+        ),
+    ]
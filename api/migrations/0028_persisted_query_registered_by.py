@@ -0,0 +1,19 @@
+# Generated by Django 2.2.5 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='persistedquery',
+            name='registered_by',
+            field=models.CharField(choices=[('COMMAND', 'Command'), ('CLIENT', 'Client')], default='CLIENT', max_length=20),
+            preserve_default=False,
+        ),
+    ]
@@ -7,6 +7,9 @@ from unicodedata import numeric
 from fractions import Fraction
 
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 
@@ -42,6 +45,8 @@ class Ingredient(models.Model):
 
     class Meta:
         unique_together = (('name', 'owner'),)
+        indexes = [GinIndex(fields=['name'], name='api_ingredient_name_trgm',
+                            opclasses=['gin_trgm_ops'])]
 
     def __str__(self):
         return self.name
@@ -59,6 +64,40 @@ class IngredientToIngredient(models.Model):
     child = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='parent')
 
 
+class IngredientStats(models.Model):
+    '''
+    How many recipes use an ingredient (by name), how many of those its owner's pantry can make
+    and how many are short of only this ingredient (blocking), and when a recipe using it was
+    last saved.  Kept by api.ingredient_stats: writes mark the rows they affect stale and reads
+    refresh the stale rows.
+    '''
+    class Meta:
+        verbose_name_plural = 'ingredient stats'
+        indexes = [models.Index(fields=['-makeable_count', '-blocking_count', '-recipe_count'])]
+
+    ingredient = models.OneToOneField(Ingredient, on_delete=models.CASCADE, primary_key=True,
+                                      related_name='stats')
+    recipe_count = models.PositiveIntegerField(default=0)
+    makeable_count = models.PositiveIntegerField(default=0)
+    blocking_count = models.PositiveIntegerField(default=0)
+    last_used = models.DateTimeField(null=True, blank=True)
+    stale = models.BooleanField(default=True)
+
+
+class IngredientClosure(models.Model):
+    '''
+    Every category an ingredient falls under, directly or through other categories, with the
+    shortest number of IngredientToIngredient steps (depth) between them.  Maintained by
+    api.categories so matching never has to walk the category graph.
+    '''
+    class Meta:
+        unique_together = (('ancestor', 'descendant'),)
+
+    ancestor = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='+')
+    descendant = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='+')
+    depth = models.PositiveIntegerField()
+
+
 class Recipe(models.Model):
     COCKTAIL = 'COCKTAIL'
     SYRUP = 'SYRUP'
@@ -97,10 +136,84 @@ class Recipe(models.Model):
     shortlist = models.BooleanField(default=False)
     today = models.BooleanField(default=False)
 
+    # weighted name/ingredients/notes/source document, maintained by api.search
+    search_document = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_document']),
+            GinIndex(fields=['name'], name='api_recipe_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
     def __str__(self):
         return self.name
 
 
+class ImportJob(models.Model):
+    '''
+    A recipe url queued to be scraped and imported in the background, see api.jobs.  There is
+    one job per url, so importing a url twice returns the existing job.
+    '''
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    url = models.URLField(max_length=2000, unique=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    recipe = models.ForeignKey(Recipe, null=True, blank=True, on_delete=models.SET_NULL)
+    error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.url} ({self.status})'
+
+
+class DataVersion(models.Model):
+    '''
+    A token that changes on every write to the data some cached result depends on, see
+    api.cache.  Kept in the database so that writes from any process (import workers, management
+    commands, a shell) invalidate what every other process cached.
+    '''
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f'{self.key} {self.version}'
+
+
+class PersistedQuery(models.Model):
+    '''
+    A GraphQL document clients may run by the sha256 hash of its text rather than sending it,
+    see api.persisted.  Registered by manage.py register_persisted_queries or, when allowed, by
+    the clients sending it.
+    '''
+    class Meta:
+        verbose_name_plural = 'persisted queries'
+
+    COMMAND = 'COMMAND'
+    CLIENT = 'CLIENT'
+
+    REGISTRARS = (
+        (COMMAND, 'Command'),
+        (CLIENT, 'Client'),
+    )
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    document = models.TextField()
+    registered_by = models.CharField(max_length=20, choices=REGISTRARS)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
 class Unit(models.Model):
     # TODO: is this how we want to handle units?
     name = models.CharField(max_length=200)
@@ -276,6 +389,26 @@ class PantryIngredient(models.Model):
         return f'{"✓" if self.in_stock else "✗"} {self.ingredient.name} - {self.id}'
 
 
+class PantryRecipeStatus(models.Model):
+    '''
+    How many, and which, non garnish ingredients of a recipe are not in stock in a pantry.  Kept
+    up to date by api.pantry_status as pantries and recipes change, so that finding the recipes
+    a pantry can make (or is one ingredient short of) is an index lookup.
+    '''
+    class Meta:
+        verbose_name_plural = 'pantry recipe statuses'
+        unique_together = (('pantry', 'recipe'),)
+        indexes = [models.Index(fields=['pantry', 'missing_count'])]
+
+    pantry = models.ForeignKey(Pantry, on_delete=models.CASCADE, related_name='recipe_statuses')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='pantry_statuses')
+    missing_count = models.PositiveIntegerField(default=0)
+    missing_ingredient_ids = ArrayField(models.IntegerField(), default=list)
+
+    def __str__(self):
+        return f'{self.recipe_id} missing {self.missing_count} - {self.pantry_id}'
+
+
 class IngredientMapping(models.Model):
     '''
     Used to map from commonly seen processed ingredients to their base ingredient which should be
@@ -4,19 +4,26 @@ from string import capwords
 import graphene
 import requests
 from django.db import IntegrityError
+from django.db.models import Q
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from graphene_file_upload.scalars import Upload
 
+from api.categories import update_closure
 from api.domain import create_recipe, create_recipe_from_plaintext, save_recipe_from_parsed_recipes, \
-    tokenize_recipes_from_plaintext, update_recipe, merge_ingredients_and_update_models
-from api.models import Pantry, Ingredient, PantryIngredient, IngredientToIngredient, Recipe
+    tokenize_recipes_from_plaintext, update_recipe, merge_ingredients_and_update_models, set_stock
+from api.jobs import enqueue_url_import
+from api.models import Pantry, Ingredient, PantryIngredient, IngredientToIngredient, Recipe, \
+    IngredientClosure
+from api.search import update_search_documents_for_ingredients
+from api.signals import pantry_updated
 from api.types import AddRecipeResponseGraphql, AddRecipesFromTextResponseGraphql, \
     LinkOrCreateIngredientsForPantryResponseGraphql, AddRecipeFlexibleResponseGraphql, \
     IngredientBulkUpdateResponseGraphql, IngredientCreateResponseGraphql, \
-    ToggleStockResponseGraphql, EditIngredientFlexibleResponseGraphql, DeleteRecipeResponseGraphql
+    ToggleStockResponseGraphql, EditIngredientFlexibleResponseGraphql, DeleteRecipeResponseGraphql, \
+    ImportRecipeFromUrlResponseGraphql, SetStockResponseGraphql
 
 from django.contrib.auth import get_user_model
 
@@ -159,6 +166,18 @@ class AddRecipesFromText(graphene.Mutation):
         return AddRecipesFromTextResponseGraphql(recipe_ids=recipes_saved_ids)
 
 
+class ImportRecipeFromUrl(graphene.Mutation):
+    class Arguments:
+        url = graphene.String(required=True)
+
+    Output = ImportRecipeFromUrlResponseGraphql
+
+    def mutate(self, info, url):
+        URLValidator()(url)
+        job = enqueue_url_import(url)
+        return ImportRecipeFromUrlResponseGraphql(job_id=job.id, status=job.status)
+
+
 class ConvertImageToRecipeText(graphene.Mutation):
     class Arguments:
         file = Upload(required=True)
@@ -255,6 +274,7 @@ class LinkOrCreateIngredientsForPantry(graphene.Mutation):
         PantryIngredient.objects.bulk_create([
             PantryIngredient(pantry=pantry, ingredient_id=i) for i in ids_to_add
         ])
+        pantry_updated.send(sender=Pantry, pantry_ids=[pantry.id], ingredient_ids=ids_to_add)
 
         return LinkOrCreateIngredientsForPantryResponseGraphql(ingredient_ids=ids_to_add)
 
@@ -292,6 +312,7 @@ class IngredientBulkUpdate(graphene.Mutation):
                 counts += Ingredient.objects.filter(id=_id).update(name=name)
             except IntegrityError:
                 merge_ingredients_and_update_models(_id, name)
+        update_search_documents_for_ingredients(ids)
         return IngredientBulkUpdateResponseGraphql(count=counts)
 
 
@@ -332,6 +353,36 @@ class ToggleStock(graphene.Mutation):
         return ToggleStockResponseGraphql(toggled_to=pi.in_stock)
 
 
+class SetStock(graphene.Mutation):
+    class Arguments:
+        ids = graphene.List(graphene.Int, required=True)
+        in_stock = graphene.Boolean(required=True)
+
+    Output = SetStockResponseGraphql
+
+    def mutate(self, info, ids, in_stock):
+        # TODO: add auth
+        changed = set_stock(PantryIngredient.objects.filter(id__in=ids), in_stock)
+        return SetStockResponseGraphql(pantry_ingredient_ids=changed, count=len(changed))
+
+
+class SetCategoryStock(graphene.Mutation):
+    '''Sets the stock of a category and of every pantry ingredient under it, such as all rums.'''
+    class Arguments:
+        id = graphene.Int(required=True)
+        in_stock = graphene.Boolean(required=False)
+
+    Output = SetStockResponseGraphql
+
+    def mutate(self, info, id, in_stock=False):
+        # TODO: add auth
+        in_category = IngredientClosure.objects.filter(ancestor_id=id).values('descendant_id')
+        changed = set_stock(PantryIngredient.objects.filter(
+            Q(ingredient_id=id) | Q(ingredient_id__in=in_category),
+            pantry__owner=User.objects.first()), in_stock)
+        return SetStockResponseGraphql(pantry_ingredient_ids=changed, count=len(changed))
+
+
 class EditIngredientFlexible(graphene.Mutation):
     class Arguments:
         id = graphene.Int(required=True)
@@ -355,6 +406,7 @@ class EditIngredientFlexible(graphene.Mutation):
             ingredient.is_generic = is_generic
 
         ingredient.save()
+        update_search_documents_for_ingredients([ingredient.id])
 
         if add_to_pantry:
             try:
@@ -372,6 +424,7 @@ class EditIngredientFlexible(graphene.Mutation):
         if categories:
             for category in categories:
                 IngredientToIngredient.objects.get_or_create(child=ingredient, parent_id=category)
+        update_closure([ingredient.id])
 
         return EditIngredientFlexibleResponseGraphql(True)
 
@@ -382,9 +435,12 @@ class Mutation(object):
     delete_recipe = DeleteRecipe.Field()
     create_user = CreateUser.Field()
     add_recipes_from_text = AddRecipesFromText.Field()
+    import_recipe_from_url = ImportRecipeFromUrl.Field()
     link_or_create_ingredients_for_pantry = LinkOrCreateIngredientsForPantry.Field()
     convert_image_to_recipe_text = ConvertImageToRecipeText.Field()
     ingredient_bulk_update = IngredientBulkUpdate.Field()
     create_ingredient = IngredientCreate.Field()
     toggle_stock = ToggleStock.Field()
+    set_stock = SetStock.Field()
+    set_category_stock = SetCategoryStock.Field()
     edit_ingredient_flexible = EditIngredientFlexible.Field()
@@ -0,0 +1,163 @@
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import F, Q, Window
+from graphene.relay import PageInfo
+from graphql_relay.utils import base64, unbase64
+
+
+# An ordering is a list of (field, descending) pairs that ends with a unique field (the id), so
+# that the values of a row identify its position.  Nulls sort last in both directions.
+
+def ordering_expressions(ordering):
+    expressions = []
+    for field, descending in ordering:
+        if field == 'id':
+            # id is never null, and plain -id/id can be read from the primary key index
+            expressions.append('-id' if descending else 'id')
+        elif descending:
+            expressions.append(F(field).desc(nulls_last=True))
+        else:
+            expressions.append(F(field).asc(nulls_last=True))
+    return expressions
+
+
+def encode_cursor(row, ordering):
+    return base64(json.dumps([getattr(row, field) for field, _ in ordering]))
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        values = json.loads(unbase64(cursor))
+    except (ValueError, TypeError, binascii.Error):
+        values = None
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise Exception('Invalid cursor')
+    return values
+
+
+def _is_nullable(model, field):
+    try:
+        return model._meta.get_field(field).null
+    except FieldDoesNotExist:
+        return False
+
+
+def _column(model, field, alias):
+    try:
+        column = model._meta.get_field(field).column
+    except FieldDoesNotExist:
+        column = field
+    return f'{alias}.{connection.ops.quote_name(column)}'
+
+
+def keyset_after(model, ordering, values):
+    '''
+    A filter for the rows that sort after the row with the given values: for some key, every
+    earlier key is equal and this key is past the value.  Nulls come after every value.
+    '''
+    after = Q(pk__in=[])
+    equal = Q()
+    for (field, descending), value in zip(ordering, values):
+        if value is None:
+            # nothing sorts past a null on this key, only equal (null) rows carry on
+            equal &= Q(**{f'{field}__isnull': True})
+            continue
+        past = Q(**{f'{field}__lt' if descending else f'{field}__gt': value})
+        if _is_nullable(model, field):
+            past |= Q(**{f'{field}__isnull': True})
+        after |= equal & past
+        equal &= Q(**{field: value})
+    return after
+
+
+def _keyset_after_sql(model, ordering, values, alias):
+    # keyset_after as SQL over the columns of a subquery
+    after, params = [], []
+    equal, equal_params = [], []
+    for (field, descending), value in zip(ordering, values):
+        column = _column(model, field, alias)
+        if value is None:
+            equal.append(f'{column} IS NULL')
+            continue
+        past = f'{column} {"<" if descending else ">"} %s'
+        if _is_nullable(model, field):
+            past = f'({past} OR {column} IS NULL)'
+        after.append('(' + ' AND '.join(equal + [past]) + ')')
+        params += equal_params + [value]
+        equal.append(f'{column} = %s')
+        equal_params.append(value)
+    return ' OR '.join(after) or 'FALSE', params
+
+
+def _ordering_sql(model, ordering, alias):
+    return ', '.join(
+        f'{_column(model, field, alias)} {"DESC" if descending else "ASC"}'
+        f'{"" if field == "id" else " NULLS LAST"}'
+        for field, descending in ordering)
+
+
+def _check_first(first):
+    if first is None or first < 1:
+        raise Exception('first must be a positive number')
+
+
+def keyset_page(queryset, ordering, first, after=None):
+    '''
+    The first rows of queryset in the given ordering that come after the cursor, and whether
+    any more follow.  The position is a WHERE predicate rather than an OFFSET, so a deep page
+    costs the same as the first.
+    '''
+    _check_first(first)
+    if after:
+        queryset = queryset.filter(keyset_after(queryset.model, ordering,
+                                                decode_cursor(after, ordering)))
+    queryset = queryset.order_by(*ordering_expressions(ordering))
+    rows = list(queryset[:first + 1])
+    return rows[:first], len(rows) > first
+
+
+def counted_keyset_page(queryset, ordering, first, after=None, counts=None):
+    '''
+    keyset_page that also returns aggregates (counts) over every row of queryset, not only the
+    page, from the same statement: the aggregates are window functions over the whole queryset
+    in a subquery, and the cursor, ORDER BY and LIMIT apply outside of it.  Only a page past the
+    end, which has no row to carry them, needs a second query for them.
+    '''
+    _check_first(first)
+    model = queryset.model
+    windowed = queryset.order_by().annotate(**{
+        name: Window(expression=aggregate) for name, aggregate in counts.items()})
+    sql, params = windowed.query.sql_with_params()
+
+    where, where_params = 'TRUE', []
+    if after:
+        where, where_params = _keyset_after_sql(model, ordering, decode_cursor(after, ordering),
+                                                'search')
+    rows = list(model.objects.raw(
+        f'SELECT * FROM ({sql}) AS search WHERE {where} '
+        f'ORDER BY {_ordering_sql(model, ordering, "search")} LIMIT %s',
+        list(params) + where_params + [first + 1],
+    ).prefetch_related(*queryset._prefetch_related_lookups))
+
+    if rows:
+        totals = {name: getattr(rows[0], name) for name in counts}
+    else:
+        totals = queryset.order_by().aggregate(**counts)
+    return rows[:first], len(rows) > first, totals
+
+
+def connection_from_rows(connection_type, rows, ordering, has_next_page, after=None, **fields):
+    edges = [connection_type.Edge(node=row, cursor=encode_cursor(row, ordering)) for row in rows]
+    return connection_type(
+        edges=edges,
+        **fields,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=bool(after),
+            has_next_page=has_next_page,
+        ),
+    )
@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction
+from django.db.models import Count, Q
+
+from api.categories import category_names
+from api.makeability import missing_filter
+from api.models import Ingredient, Pantry, PantryIngredient, PantryRecipeStatus, Recipe, \
+    RecipeIngredient
+
+
+def recipes_using(ingredient_ids):
+    '''
+    Ids of the recipes needing an ingredient named like one of ingredient_ids or a category
+    above them, as a subquery.  The ingredient index of the recipe ingredients is the reverse
+    index from a pantry bottle to the recipes its stock can change.
+    '''
+    names = Ingredient.objects.filter(id__in=ingredient_ids).values('name')
+    return RecipeIngredient.objects.filter(
+        Q(ingredient__name__in=names) | Q(ingredient__name__in=category_names(ingredient_ids)))\
+        .values('beverage_id')
+
+
+def _statuses(pantry_id, recipe_ids):
+    missing = missing_filter(PantryIngredient.objects.filter(pantry_id=pantry_id, in_stock=True))
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    return recipes.order_by().annotate(
+        missing=Count('recipeingredient', filter=missing),
+        missing_ids=ArrayAgg('recipeingredient__ingredient_id', filter=missing,
+                             ordering='recipeingredient__id'),
+    ).values_list('id', 'missing', 'missing_ids')
+
+
+def refresh_pantry_statuses(pantry_ids=None, recipe_ids=None, create=True):
+    '''
+    Recomputes the statuses of the given pantries and recipes (ids or a subquery of ids, every
+    one when None) and writes the rows that changed.  Without create only existing rows are
+    updated: stock changes never add a (pantry, recipe) pair, only new pantries and recipes do.
+    '''
+    pantries = Pantry.objects.order_by('id')
+    if pantry_ids is not None:
+        pantries = pantries.filter(id__in=pantry_ids)
+
+    changed, added = [], []
+    for pantry_id in pantries.values_list('id', flat=True):
+        existing = PantryRecipeStatus.objects.filter(pantry_id=pantry_id)
+        if recipe_ids is not None:
+            existing = existing.filter(recipe_id__in=recipe_ids)
+        existing = {status.recipe_id: status for status in existing}
+
+        for recipe_id, count, ingredient_ids in _statuses(pantry_id, recipe_ids):
+            status = existing.get(recipe_id)
+            if status is None:
+                if create:
+                    added.append(PantryRecipeStatus(
+                        pantry_id=pantry_id, recipe_id=recipe_id, missing_count=count,
+                        missing_ingredient_ids=ingredient_ids))
+            elif status.missing_count != count or status.missing_ingredient_ids != ingredient_ids:
+                status.missing_count = count
+                status.missing_ingredient_ids = ingredient_ids
+                changed.append(status)
+
+    with transaction.atomic():
+        PantryRecipeStatus.objects.bulk_update(
+            changed, ['missing_count', 'missing_ingredient_ids'], batch_size=1000)
+        # a concurrent refresh may have added the same new rows
+        PantryRecipeStatus.objects.bulk_create(added, batch_size=1000, ignore_conflicts=True)
+    return len(changed) + len(added)
+
+
+def _enabled():
+    return settings.PANTRY_FILTER_BACKEND == 'table'
+
+
+def _pantry_ingredient_changed(sender, instance, **kwargs):
+    if _enabled():
+        refresh_pantry_statuses([instance.pantry_id], recipes_using([instance.ingredient_id]),
+                                create=False)
+
+
+def _pantry_saved(sender, instance, created, **kwargs):
+    if _enabled() and created:
+        refresh_pantry_statuses([instance.id])
+
+
+def _recipe_saved(sender, instance, created, **kwargs):
+    if _enabled() and created:
+        refresh_pantry_statuses(recipe_ids=[instance.id])
+
+
+def _pantry_updated(sender, pantry_ids, ingredient_ids=None, **kwargs):
+    if _enabled():
+        recipe_ids = None if ingredient_ids is None else recipes_using(ingredient_ids)
+        refresh_pantry_statuses(pantry_ids, recipe_ids, create=False)
+
+
+def _ingredients_updated(sender, ingredient_ids, **kwargs):
+    # renames and merges can match (or stop matching) pantry bottles of the same name
+    if _enabled():
+        refresh_pantry_statuses(recipe_ids=recipes_using(ingredient_ids), create=False)
+
+
+def _categories_updated(sender, ingredient_ids, **kwargs):
+    # pantries holding something under these categories may now (or no longer) satisfy them
+    if _enabled():
+        refresh_pantry_statuses(recipe_ids=recipes_using(ingredient_ids), create=False)
+
+
+def _search_documents_updated(sender, recipe_ids, **kwargs):
+    # sent whenever the ingredients of recipes are saved or updated
+    if _enabled():
+        refresh_pantry_statuses(recipe_ids=recipe_ids)
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+
+    from api.signals import categories_updated, ingredients_updated, pantry_updated, \
+        search_documents_updated
+
+    post_save.connect(_pantry_ingredient_changed, sender=PantryIngredient)
+    post_delete.connect(_pantry_ingredient_changed, sender=PantryIngredient)
+    post_save.connect(_pantry_saved, sender=Pantry)
+    post_save.connect(_recipe_saved, sender=Recipe)
+    pantry_updated.connect(_pantry_updated)
+    ingredients_updated.connect(_ingredients_updated)
+    categories_updated.connect(_categories_updated)
+    search_documents_updated.connect(_search_documents_updated)
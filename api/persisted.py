@@ -0,0 +1,141 @@
+import hashlib
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from graphql import GraphQLError, parse, validate
+
+from api.cost import CostLimitBackend
+from api.models import PersistedQuery
+
+
+class PersistedQueryError(Exception):
+    pass
+
+
+def query_hash(document):
+    return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+
+def register_query(schema, document, registered_by=PersistedQuery.COMMAND):
+    '''
+    Stores a document for clients to run by its hash, which is returned.  Only documents that
+    are valid against schema are accepted.  A document a client registered first is taken over
+    when the command registers it.
+    '''
+    try:
+        errors = validate(schema, parse(document))
+    except GraphQLError as e:
+        errors = [e]
+    if errors:
+        raise PersistedQueryError('; '.join(error.message for error in errors))
+    sha256 = query_hash(document)
+    _, created = PersistedQuery.objects.get_or_create(
+        sha256=sha256, defaults={'document': document, 'registered_by': registered_by})
+    if not created and registered_by == PersistedQuery.COMMAND:
+        PersistedQuery.objects.filter(sha256=sha256).update(registered_by=registered_by)
+    return sha256
+
+
+# the last GRAPHQL_DOCUMENT_CACHE_SIZE documents read, with who registered them: a registered
+# document never changes, and is only ever taken over by the command
+_documents = OrderedDict()
+_documents_lock = Lock()
+
+
+def persisted_document(sha256):
+    '''
+    The registered document with the given hash, or None.  With PERSISTED_QUERIES_ONLY only the
+    documents registered with manage.py register_persisted_queries are found.
+    '''
+    only_command = settings.PERSISTED_QUERIES_ONLY
+    with _documents_lock:
+        found = _documents.get(sha256)
+        if found is not None:
+            _documents.move_to_end(sha256)
+    if found is None or (only_command and found[1] != PersistedQuery.COMMAND):
+        queries = PersistedQuery.objects.filter(sha256=sha256)
+        if only_command:
+            queries = queries.filter(registered_by=PersistedQuery.COMMAND)
+        found = queries.values_list('document', 'registered_by').first()
+        if found is None:
+            return None
+        with _documents_lock:
+            _documents[sha256] = found
+            while len(_documents) > settings.GRAPHQL_DOCUMENT_CACHE_SIZE:
+                _documents.popitem(last=False)
+    return found[0]
+
+
+def _register_client_query(schema, query):
+    # only while the client registered documents are fewer than PERSISTED_QUERIES_CLIENT_LIMIT
+    if not settings.PERSISTED_QUERIES_CLIENT_REGISTRATION:
+        return
+    limit = settings.PERSISTED_QUERIES_CLIENT_LIMIT
+    if limit is not None and PersistedQuery.objects.filter(
+            registered_by=PersistedQuery.CLIENT).count() >= limit:
+        return
+    try:
+        register_query(schema, query, PersistedQuery.CLIENT)
+    except PersistedQueryError:
+        # run anyway, to report what is wrong with it
+        pass
+
+
+def resolve_query(schema, query, sha256):
+    '''
+    The document to run for a request sending the query text, the sha256 hash of a persisted
+    query or both (as in automatic persisted queries: a client sends the hash alone first and
+    only sends the text when told it is not found, which registers it when
+    PERSISTED_QUERIES_CLIENT_REGISTRATION allows).  With PERSISTED_QUERIES_ONLY only the
+    documents registered with manage.py register_persisted_queries can be run.
+    '''
+    if sha256 is None:
+        if query and settings.PERSISTED_QUERIES_ONLY:
+            raise PersistedQueryError('PersistedQueryNotSupported')
+        return query
+    if query and query_hash(query) != sha256:
+        raise PersistedQueryError('provided sha does not match query')
+
+    document = persisted_document(sha256)
+    if document is not None:
+        return document
+    if not query or settings.PERSISTED_QUERIES_ONLY:
+        raise PersistedQueryError('PersistedQueryNotFound')
+    _register_client_query(schema, query)
+    return query
+
+
+class DocumentCacheBackend(CostLimitBackend):
+    '''
+    CostLimitBackend keeping the last GRAPHQL_DOCUMENT_CACHE_SIZE valid documents it parsed by
+    the hash of their text, so that a document seen before (a persisted one above all) is
+    neither parsed nor validated again.
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._documents = OrderedDict()
+        self._lock = Lock()
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+        key = (id(schema), query_hash(document_string))
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                return document
+
+        document = super().document_from_string(schema, document_string)
+        if validate(schema, document.document_ast):
+            # not kept, execute validates it again to report the errors
+            return document
+        document.execute = partial(document.execute, validate=False)
+        with self._lock:
+            self._documents[key] = document
+            while len(self._documents) > settings.GRAPHQL_DOCUMENT_CACHE_SIZE:
+                self._documents.popitem(last=False)
+        return document
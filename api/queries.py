@@ -1,25 +1,34 @@
-import re
 from urllib.parse import urlparse
 
 import graphene
 
-from collections import Counter
-
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
-from django.contrib.postgres.search import SearchVector, SearchQuery
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
-from django.core.paginator import Paginator
-from django.db.models import Prefetch, F
-from graphene import ObjectType
+from graphene import ObjectType, relay
 
 from graphene_django.types import DjangoObjectType
 
-from api.domain import create_recipe_from_url, save_recipe_from_parsed_recipes
+from api.autocomplete import autocomplete_index, INGREDIENT, RECIPE, SOURCE
+from api.cache import data_version, search_cache, search_key, sort_key
+from api.ingredient_stats import refresh_stale_stats
+from api.jobs import enqueue_url_import
+from api.loaders import loaders
 from api.models import Ingredient, Recipe, RecipeIngredient, PantryIngredient, Pantry, \
-    IngredientToIngredient
+    ImportJob, IngredientStats
 from api.mutations import UserType
+from api.makeability import filter_makeable, missing_ingredients, next_purchases
+from api.pagination import connection_from_rows, counted_keyset_page, keyset_page, \
+    ordering_expressions
+from api.search import parse_search_term, plan_recipe_search, recipe_ordering, \
+    recipe_search_counts, TrigramWordSimilarity, FACET_FIELDS
+from api.selections import plan_related, project, selected_fields, Fetch
+from api.shopping import shopping_list
+
+
+# users_pantry ordering: the bottles most recipes can be made with (or are waiting on) first
+MOST_USEFUL = 'useful'
 
 
 class SimpleIngredientType(ObjectType):
@@ -27,27 +36,40 @@ class SimpleIngredientType(ObjectType):
     name = graphene.String()
 
 
+class AutocompleteType(ObjectType):
+    ingredients = graphene.List(graphene.String)
+    recipes = graphene.List(graphene.String)
+    sources = graphene.List(graphene.String)
+
+
+class IngredientStatsType(DjangoObjectType):
+    class Meta:
+        model = IngredientStats
+        exclude = ('ingredient', 'stale')
+
+
 class IngredientType(DjangoObjectType):
     class Meta:
         model = Ingredient
 
+    stats = graphene.Field(IngredientStatsType)
+
+    def resolve_stats(self, info):
+        return loaders(info).stats.load(self.id)
+
     categories_list = graphene.String()
 
     def resolve_categories_list(self, info):
-        categories = [i.parent.name for i in IngredientToIngredient.objects.filter(
-            child_id=self.id).prefetch_related('parent')]
-
-        return ', '.join(categories)
+        return loaders(info).parents.load(self.id).then(
+            lambda parents: ', '.join(parent.name for parent in parents))
 
     categories = graphene.List(SimpleIngredientType)
 
     def resolve_categories(self, info):
-        parents = [i.parent for i in IngredientToIngredient.objects.filter(
-            child_id=self.id).prefetch_related('parent')]
-        return [{
+        return loaders(info).parents.load(self.id).then(lambda parents: [{
             'id': parent.id,
             'name': parent.name
-        } for parent in parents]
+        } for parent in parents])
 
 
 class RecipeIngredientType(DjangoObjectType):
@@ -58,6 +80,7 @@ class RecipeIngredientType(DjangoObjectType):
 class RecipeType(DjangoObjectType):
     class Meta:
         model = Recipe
+        exclude_fields = ('search_document',)
 
     source_or_url = graphene.String()
 
@@ -97,68 +120,135 @@ class RecipeType(DjangoObjectType):
             return ', '.join(ingredient.name for ingredient in self.missing_ingredient_models)
 
 
+# the columns custom resolvers read, for project (model fields selected directly need none)
+RECIPE_COLUMNS = {
+    'sourceOrUrl': ['source', 'source_url'],
+}
+# stats and categories read only the id (through api.loaders)
+INGREDIENT_COLUMNS = {}
+PANTRY_INGREDIENT_COLUMNS = {
+    'stats': ['ingredient'],
+}
+
+# what resolving each field reads beyond the row itself, for plan_related
+RECIPE_INGREDIENTS = Fetch('recipeingredient_set', RecipeIngredient.objects.all(),
+                           select=('ingredient', 'quantity__unit'))
+RECIPE_RELATIONS = {
+    # prefetched rather than joined, as the pages of counted_keyset_page are raw querysets
+    'owner': [Fetch('owner', User.objects.all())],
+    'ingredients': [Fetch('ingredients', Ingredient.objects.all(), columns=INGREDIENT_COLUMNS)],
+    'ingredientsText': [Fetch('ingredients', Ingredient.objects.only('name', 'is_garnish'),
+                              to_attr='ingredient_list')],
+    'allIngredients': [RECIPE_INGREDIENTS],
+    'garnishes': [RECIPE_INGREDIENTS],
+    'recipeingredientSet': [RECIPE_INGREDIENTS],
+}
+
+
 class PantryIngredientType(DjangoObjectType):
     class Meta:
         model = PantryIngredient
 
+    stats = graphene.Field(IngredientStatsType)
+
+    def resolve_ingredient(self, info):
+        return loaders(info).ingredients.load(self.ingredient_id)
+
+    def resolve_stats(self, info):
+        return loaders(info).stats.load(self.ingredient_id)
+
+
+class ImportJobType(DjangoObjectType):
+    class Meta:
+        model = ImportJob
+
+
+class NextPurchaseType(ObjectType):
+    ingredient = graphene.Field(IngredientType)
+    score = graphene.Float()
+    unlocked_count = graphene.Int()
+    unlocked_recipes = graphene.List(RecipeType)
+
+
+class AmountType(ObjectType):
+    amount = graphene.Float()
+    unit = graphene.String()
+
+
+class ShoppingListItemType(ObjectType):
+    ingredient = graphene.Field(IngredientType)
+    amounts = graphene.List(AmountType)
+    unmeasured = graphene.Int()
+    recipe_count = graphene.Int()
+
+    def resolve_amounts(self, info):
+        return [AmountType(amount=round(amount, 2), unit=unit)
+                for unit, amount in self.amounts.items()]
+
+    def resolve_recipe_count(self, info):
+        return len(self.recipe_ids)
+
+
+class RecipeSearchFacetsType(ObjectType):
+    shortlist = graphene.Int()
+    today = graphene.Int()
+    partner_likes = graphene.Int()
+    non_alcoholic = graphene.Int()
+
+
+class RecipeConnection(relay.Connection):
+    class Meta:
+        node = RecipeType
+
+    total_count = graphene.Int()
+    facets = graphene.Field(RecipeSearchFacetsType)
+    # set when the search term was a url, whose recipe is being imported
+    import_job = graphene.Field(ImportJobType)
+
+
+class IngredientConnection(relay.Connection):
+    class Meta:
+        node = IngredientType
+
 
 def _filter_on_pantry(current_filtered, user, allowances=0):
-    filtered = []
-
-    pantry = Pantry.objects.filter(owner=user).first()
-    pantry_ingredients = PantryIngredient.objects\
-        .filter(pantry=pantry, in_stock=True).select_related('ingredient').order_by('-id')
-    ingredients = [pi.ingredient for pi in pantry_ingredients]
-
-    ids = {p.id for p in ingredients}
-    names = [p.name for p in ingredients]
-    for recipe in current_filtered:
-        missing_ingredients = []
-        in_pantry = True
-        current_allowances = allowances
-        for ingredient in recipe.recipeingredient_set.all():
-            if (
-                not ingredient.ingredient.is_garnish
-                and ingredient.ingredient.id not in ids
-                and ingredient.ingredient.name not in names
-            ):
-                missing_ingredients.append(ingredient.ingredient)
-                if not current_allowances:
-                    in_pantry = False
-                    break
-                else:
-                    current_allowances -= 1
-
-        # in_pantry = not any(
-        #     ingredient.ingredient.id not in ids and ingredient.ingredient.name not in names
-        #     for ingredient in recipe.recipeingredient_set.all()
-        #     if not ingredient.ingredient.is_garnish
-        # )
-        if missing_ingredients:
-            recipe.missing_ingredient_models = missing_ingredients
-        if in_pantry:
-            filtered.append(recipe)
-    return filtered
+    # ordering, counting and paging of the result all stay in the database
+    return filter_makeable(current_filtered, user, allowances=allowances)
+
+
+def _set_missing_ingredients(recipes, user):
+    '''Sets missing_ingredient_models on the recipes (of a page) that are missing any.'''
+    missing = missing_ingredients([recipe.id for recipe in recipes], user)
+    for recipe in recipes:
+        if missing[recipe.id]:
+            recipe.missing_ingredient_models = missing[recipe.id]
+    return recipes
+
+
+def ingredient_ordering(search_term, fuzzy=False):
+    if fuzzy and search_term is not None:
+        return [('similarity', True), ('name', False), ('id', False)]
+    return [('name', False), ('id', False)]
 
 
-def filter_ingredients(is_garnish, search_term):
+def filter_ingredients(is_garnish, search_term, fuzzy=False):
+    ordering = ordering_expressions(ingredient_ordering(search_term, fuzzy=fuzzy))
     if search_term is None:
-        return Ingredient.objects.filter(is_garnish=is_garnish)
+        return Ingredient.objects.filter(is_garnish=is_garnish).order_by(*ordering)
     filtered = Ingredient.objects.filter(is_garnish=is_garnish)
-    filtered = filtered.filter(name__icontains=search_term)
+    if fuzzy:
+        return filtered.filter(name__trigram_word_similar=search_term)\
+            .annotate(similarity=TrigramWordSimilarity(search_term, 'name'))\
+            .order_by(*ordering)
+    filtered = filtered.filter(name__icontains=search_term).order_by(*ordering)
     return filtered
 
 
-def get_searched_recipes(info, search_term, allowances, shortlist, today, partner_likes,
-                         get_count=False, sorted_by=None, desc=None):
-    print(search_term)
-    # TODO: add ability for multiple search filters via commas or semicolons
-    def get_in_quotes_and_whats_left(text):
-        found = re.findall('"([^"]*)"', text)
-        left = re.sub('"([^"]*)"', '', text)
-        return found, left
-
-    # handle possible url
+def _import_url_search(search_term):
+    '''
+    A url typed into the search queues an import of the recipe at that url, and then every
+    recipe is searched.  Returns the search term to use and the import job, if any.
+    '''
     validator = URLValidator()
     if search_term:
         try:
@@ -166,115 +256,106 @@ def get_searched_recipes(info, search_term, allowances, shortlist, today, partne
         except ValidationError:
             pass
         else:
-            # add new recipe and search on all
-            recipe = create_recipe_from_url(search_term)
-            save_recipe_from_parsed_recipes(recipe)
-            search_term = ''
-
-    vectors = SearchVector('name', config='english_unaccent', weight='A') + \
-              SearchVector('ingredients__name', config='english_unaccent', weight='A') + \
-              SearchVector('recipeingredient__note', config='english_unaccent', weight='B') + \
-              SearchVector('source', config='english_unaccent', weight='B') + \
-              SearchVector('source_url', config='english_unaccent', weight='B')
-
-    exact_ids = None
-    if not search_term:
-        current_filtered = Recipe.objects.all()\
-            .prefetch_related(
-                Prefetch('ingredients', to_attr='ingredient_list',
-                         queryset=Ingredient.objects.all().only('name', 'is_garnish')))\
-            .order_by('-id')\
-            .only('id', 'source', 'source_url', 'name', 'shortlist', 'today',
-                  'rating', 'non_alcoholic')
-    else:
-        recipes = Recipe.objects.all().prefetch_related(
-                Prefetch('ingredients', to_attr='ingredient_list',
-                         queryset=Ingredient.objects.all().only('name', 'is_garnish')))
-
-        if '"' in search_term:
-            if Counter(search_term)['"'] % 2 != 0:
-                return None
-
-            exact_matches, non_exact = get_in_quotes_and_whats_left(search_term)
-            search_term = non_exact.strip()
-            if exact_matches:
-                exact_ids = set()
-                for match in exact_matches:
-                    recipes = Recipe.objects.all()
-                    if exact_ids:
-                        recipes.filter(id__in=exact_ids)
-                    recipes = recipes.annotate(search=vectors)\
-                        .filter(search=SearchQuery(match, search_type='phrase',
-                                                   config='english_unaccent'))
-                    if exact_ids:
-                        exact_ids = exact_ids & set(recipes.values_list('id', flat=True))
-                    else:
-                        exact_ids = set(recipes.values_list('id', flat=True))
-
-        ids = recipes.annotate(search=vectors)\
-            .filter(search__icontains=search_term)\
-            .values_list('id', flat=True)
-
-        search_terms = search_term.split()
-        # if we want to filter on individual terms using OR
-        # my_filter = search_term
-        # if search_terms:
-        #     my_filter = SearchQuery(search_terms.pop())
-        #     for t in search_terms:
-        #         my_filter &= SearchQuery(t)
-
-        extra_ids = []
-        for term in search_terms:
-            extra = Recipe.objects.annotate(search=vectors)\
-                .filter(search__icontains=term).values_list('id', flat=True)
-            extra_ids += extra
-
-        final_ids = Recipe.objects\
-            .annotate(search=vectors)\
-            .filter(search=SearchQuery(search_term)).values_list('id', flat=True)
-
-        ids = set(ids) | set(extra_ids) | set(final_ids)
-        if exact_ids:
-            ids = ids & exact_ids
-        current_filtered = Recipe.objects.filter(id__in=ids)\
-            .prefetch_related(
-                Prefetch('ingredients', to_attr='ingredient_list',
-                         queryset=Ingredient.objects.all()
-            .only('name', 'is_garnish'))).order_by('-id')
-    if shortlist:
-        current_filtered = current_filtered.filter(shortlist=True)
-    if today:
-        current_filtered = current_filtered.filter(today=True)
-    if partner_likes:
-        current_filtered = current_filtered.filter(partner_likes=True)
-
-    # sorted by:
-    # name, ingredientsText, rating, source
-    if sorted_by in {'name', 'rating'}:
-        if desc:
-            order_by = F(sorted_by).desc(nulls_last=True)
-        else:
-            order_by = F(sorted_by).asc(nulls_last=True)
-        current_filtered = current_filtered.order_by(order_by)
+            # import the new recipe in the background and search on all
+            return '', enqueue_url_import(search_term)
+    return search_term, None
+
+
+def get_searched_recipes(info, search_term, allowances, shortlist, today, partner_likes,
+                         sorted_by=None, desc=None, fuzzy=False):
+    print(search_term)
+    # TODO: add ability for multiple search filters via commas or semicolons
+    search_term, _ = _import_url_search(search_term)
+
+    parsed = parse_search_term(search_term)
+    if parsed is None:
+        return None
+    current_filtered = plan_recipe_search(parsed, shortlist=shortlist, today=today,
+                                          partner_likes=partner_likes,
+                                          sorted_by=sorted_by, desc=desc, fuzzy=fuzzy)
     if allowances != -1:
         # TODO: add auth!
         current_filtered = _filter_on_pantry(current_filtered, User.objects.first(),
                                              allowances=allowances)
-    if get_count:
-        return current_filtered.count()
     return current_filtered
 
 
+def search_recipe_ids(info, search_term, allowances, shortlist, today, partner_likes,
+                      sorted_by=None, desc=None, fuzzy=False, limit=None):
+    '''
+    The ordered ids of the recipes matching the search, from the search cache unless something
+    was written since the search last ran.  With a limit only that many ids are needed, and the
+    search stops (LIMIT) once it has found them rather than ordering every result.  None when the
+    search term can not be parsed.
+    '''
+    search = search_key(search_term, allowances, shortlist, today, partner_likes, fuzzy)
+    if search is None:
+        return None
+    sort = sort_key(sorted_by, desc)
+    version = data_version()
+
+    ids, complete = search_cache.get_ids(version, search, sort)
+    if ids is not None and (complete or limit is not None and len(ids) >= limit):
+        return ids[:limit]
+
+    recipes = get_searched_recipes(info, search_term, allowances, shortlist, today,
+                                   partner_likes, sorted_by=sort[0], desc=sort[1], fuzzy=fuzzy)\
+        .values_list('id', flat=True)
+    if limit is None:
+        ids, complete = list(recipes), True
+    else:
+        # read ahead of the page, so paging on fetches a longer prefix each time
+        wanted = max(limit, 2 * len(ids or ()))
+        ids = list(recipes[:wanted])
+        complete = len(ids) < wanted
+    search_cache.set_ids(version, search, sort, ids, complete)
+    return ids[:limit]
+
+
+def count_searched_recipes(info, search_term, allowances, shortlist, today, partner_likes,
+                           fuzzy=False):
+    '''The number of recipes matching the search, counted on its own and cached per search.'''
+    search = search_key(search_term, allowances, shortlist, today, partner_likes, fuzzy)
+    if search is None:
+        return None
+    version = data_version()
+    total = search_cache.get_total(version, search)
+    if total is None:
+        total = get_searched_recipes(info, search_term, allowances, shortlist, today,
+                                     partner_likes, fuzzy=fuzzy).order_by().count()
+        search_cache.set_total(version, search, total)
+    return total
+
+
+def plan_recipes(recipes, info, path=(), keep=()):
+    '''recipes with the relations and only the columns the selected RecipeType fields need.'''
+    recipes = plan_related(recipes, info, RECIPE_RELATIONS, path=path)
+    return project(recipes, info, RECIPE_COLUMNS, path=path, keep=keep)
+
+
+def load_recipe_page(info, ids, allowances):
+    '''
+    The recipes with the given ids, in that order, with the relations the selected fields need
+    and what they need from the pantry when searching with allowances.
+    '''
+    recipes = plan_recipes(Recipe.objects.filter(id__in=ids), info)
+    by_id = {recipe.id: recipe for recipe in recipes}
+    page = [by_id[recipe_id] for recipe_id in ids if recipe_id in by_id]
+    if allowances != -1:
+        _set_missing_ingredients(page, User.objects.first())
+    return page
+
+
 class Query(object):
     all_ingredients = graphene.List(IngredientType)
 
     def resolve_all_ingredients(self, info, **kwargs):
-        return Ingredient.objects.all()
+        return project(Ingredient.objects.all(), info, INGREDIENT_COLUMNS)
 
     all_ingredients_not_garnish = graphene.List(IngredientType)
 
     def resolve_all_ingredients_not_garnish(self, info, **kwargs):
-        return Ingredient.objects.filter(is_garnish=False)
+        return project(Ingredient.objects.filter(is_garnish=False), info, INGREDIENT_COLUMNS)
 
     users = graphene.List(UserType)
 
@@ -297,21 +378,12 @@ class Query(object):
         if user.is_anonymous:
             raise Exception('Not logged in!')
 
-        ri_query = RecipeIngredient.objects.select_related('ingredient', 'quantity__unit')
-        return Recipe.objects.filter(
-            owner=user, recipe_type=Recipe.COCKTAIL
-        ).prefetch_related(
-            Prefetch(
-                'recipeingredient_set',
-                queryset=ri_query,
-                to_attr='ingredients_set',
-            )
-        )
+        return plan_recipes(Recipe.objects.filter(owner=user, recipe_type=Recipe.COCKTAIL), info)
 
     users_recipe = graphene.Field(RecipeType, id=graphene.Int(required=True))
 
     def resolve_users_recipe(self, info, id):
-        return Recipe.objects.get(pk=id)
+        return plan_recipes(Recipe.objects.all(), info).get(pk=id)
 
     searched_recipes = graphene.List(RecipeType,
                                      first=graphene.Int(required=True),
@@ -322,54 +394,122 @@ class Query(object):
                                      today=graphene.Boolean(required=False),
                                      partner_likes=graphene.Boolean(required=False),
                                      sorted_by=graphene.String(required=False),
-                                     desc=graphene.Boolean(required=False))
+                                     desc=graphene.Boolean(required=False),
+                                     fuzzy=graphene.Boolean(required=False))
 
     def resolve_searched_recipes(self, info, first, page, search_term=None, allowances=0,
                                  shortlist=False, today=False, partner_likes=False, sorted_by=None,
-                                 desc=None):
-        recipes = get_searched_recipes(info, search_term, allowances, shortlist, today,
-                                       partner_likes, sorted_by=sorted_by, desc=desc)
-
-        paginator = Paginator(recipes, first)
-        current_page = page//first
-        return paginator.page(current_page+1).object_list
+                                 desc=None, fuzzy=False):
+        offset = page//first*first
+        ids = search_recipe_ids(info, search_term, allowances, shortlist, today, partner_likes,
+                                sorted_by=sorted_by, desc=desc, fuzzy=fuzzy,
+                                limit=offset + first)
 
+        if ids is None:
+            return None
+        return load_recipe_page(info, ids[offset:offset+first], allowances)
 
     searched_recipes_count = graphene.Int(search_term=graphene.String(required=False),
                                           allowances=graphene.Int(required=False),
                                           shortlist=graphene.Boolean(required=False),
                                           today=graphene.Boolean(required=False),
-                                          partner_likes=graphene.Boolean(required=False))
+                                          partner_likes=graphene.Boolean(required=False),
+                                          fuzzy=graphene.Boolean(required=False))
 
     def resolve_searched_recipes_count(self, info, search_term=None, allowances=0,
-                                       shortlist=False, today=False, partner_likes=None):
-        return get_searched_recipes(
-            info, search_term, allowances, shortlist, today, partner_likes, get_count=True)
+                                       shortlist=False, today=False, partner_likes=None,
+                                       fuzzy=False):
+        return count_searched_recipes(info, search_term, allowances, shortlist, today,
+                                      partner_likes, fuzzy=fuzzy)
+
+    recipe_search = graphene.Field(RecipeConnection,
+                                   first=graphene.Int(required=True),
+                                   after=graphene.String(required=False),
+                                   search_term=graphene.String(required=False),
+                                   allowances=graphene.Int(required=False),
+                                   shortlist=graphene.Boolean(required=False),
+                                   today=graphene.Boolean(required=False),
+                                   partner_likes=graphene.Boolean(required=False),
+                                   sorted_by=graphene.String(required=False),
+                                   desc=graphene.Boolean(required=False),
+                                   fuzzy=graphene.Boolean(required=False))
+
+    def resolve_recipe_search(self, info, first, after=None, search_term=None, allowances=0,
+                              shortlist=False, today=False, partner_likes=False, sorted_by=None,
+                              desc=None, fuzzy=False):
+        search_term, import_job = _import_url_search(search_term)
+        parsed = parse_search_term(search_term)
+        if parsed is None:
+            return None
+        recipes = plan_recipe_search(parsed, shortlist=shortlist, today=today,
+                                     partner_likes=partner_likes,
+                                     sorted_by=sorted_by, desc=desc, fuzzy=fuzzy)
+        ordering = recipe_ordering(parsed, sorted_by=sorted_by, desc=desc, fuzzy=fuzzy)
+        recipes = plan_recipes(recipes, info, path=('edges', 'node'),
+                               keep=[field for field, _ in ordering])
+        counted = bool({'totalCount', 'facets'} & selected_fields(info))
+
+        if allowances != -1:
+            # TODO: add auth!
+            user = User.objects.first()
+            recipes = _filter_on_pantry(recipes, user, allowances=allowances)
+
+        counts = None
+        if counted:
+            page, has_next_page, counts = counted_keyset_page(recipes, ordering, first, after,
+                                                              counts=recipe_search_counts())
+        else:
+            page, has_next_page = keyset_page(recipes, ordering, first, after)
+        if allowances != -1:
+            _set_missing_ingredients(page, user)
+
+        fields = {'import_job': import_job}
+        if counts is not None:
+            fields['total_count'] = counts['total_count']
+            fields['facets'] = RecipeSearchFacetsType(
+                **{field: counts[f'{field}_count'] for field in FACET_FIELDS})
+        return connection_from_rows(RecipeConnection, page, ordering, has_next_page, after,
+                                    **fields)
+
+    import_job = graphene.Field(ImportJobType, id=graphene.Int(required=True))
+
+    def resolve_import_job(self, info, id):
+        return ImportJob.objects.filter(id=id).first()
 
     recipe = graphene.Field(RecipeType, recipe_id=graphene.Int(required=True))
 
     def resolve_recipe(self, info, recipe_id):
-        return Recipe.objects.filter(id=recipe_id).prefetch_related('ingredients').first()
+        return plan_recipes(Recipe.objects.filter(id=recipe_id), info).first()
 
-    users_pantry = graphene.List(PantryIngredientType, id=graphene.Int(required=True))
+    users_pantry = graphene.List(PantryIngredientType, id=graphene.Int(required=True),
+                                 sorted_by=graphene.String(required=False))
 
-    def resolve_users_pantry(self, info, id):
+    def resolve_users_pantry(self, info, id, sorted_by=None):
         # owner = User.objects.get(id=1)
         # TODO: setup login!!!
 
         try:
             pantry = Pantry.objects.filter(owner_id=1).prefetch_related('pantry_ingredients').first()
-            return pantry.pantry_ingredients.filter(ingredient__is_garnish=False)
+            pantry_ingredients = pantry.pantry_ingredients.filter(ingredient__is_garnish=False)
         except AttributeError:
             return []
 
+        if sorted_by == MOST_USEFUL:
+            refresh_stale_stats(pantry_ingredients.values('ingredient_id'))
+            pantry_ingredients = pantry_ingredients.order_by(
+                '-ingredient__stats__makeable_count', '-ingredient__stats__blocking_count',
+                '-ingredient__stats__recipe_count', 'id')
+        return project(pantry_ingredients, info, PANTRY_INGREDIENT_COLUMNS)
+
     # TODO: add pantry filter search
 
     get_filtered_ingredients_count = graphene.Int(is_garnish=graphene.Boolean(required=False),
-                                                  search_term=graphene.String(required=False))
+                                                  search_term=graphene.String(required=False),
+                                                  fuzzy=graphene.Boolean(required=False))
 
-    def resolve_get_filtered_ingredients_count(self, info, is_garnish=False, search_term=None):
-        ingredients = filter_ingredients(is_garnish, search_term)
+    def resolve_get_filtered_ingredients_count(self, info, is_garnish=False, search_term=None,
+                                               fuzzy=False):
+        ingredients = filter_ingredients(is_garnish, search_term, fuzzy=fuzzy)
         return ingredients.count()
 
 
@@ -377,18 +517,78 @@ class Query(object):
                                          first=graphene.Int(required=True),
                                          page=graphene.Int(required=True),
                                          is_garnish=graphene.Boolean(required=False),
-                                         search_term=graphene.String(required=False))
-
-    def resolve_filtered_ingredients(self, info, first, page, is_garnish=False, search_term=None):
-        ingredients = filter_ingredients(is_garnish, search_term)
-        paginator = Paginator(ingredients, first)
-        current_page = page//first
-        return paginator.page(current_page+1).object_list
+                                         search_term=graphene.String(required=False),
+                                         fuzzy=graphene.Boolean(required=False))
+
+    def resolve_filtered_ingredients(self, info, first, page, is_garnish=False, search_term=None,
+                                     fuzzy=False):
+        ingredients = filter_ingredients(is_garnish, search_term, fuzzy=fuzzy)
+        offset = page//first*first
+        ingredients = ingredients[offset:offset+first]
+        return project(ingredients, info, INGREDIENT_COLUMNS)
+
+    ingredient_search = graphene.Field(IngredientConnection,
+                                       first=graphene.Int(required=True),
+                                       after=graphene.String(required=False),
+                                       is_garnish=graphene.Boolean(required=False),
+                                       search_term=graphene.String(required=False),
+                                       fuzzy=graphene.Boolean(required=False))
+
+    def resolve_ingredient_search(self, info, first, after=None, is_garnish=False,
+                                  search_term=None, fuzzy=False):
+        ordering = ingredient_ordering(search_term, fuzzy=fuzzy)
+        ingredients = project(filter_ingredients(is_garnish, search_term, fuzzy=fuzzy), info,
+                              INGREDIENT_COLUMNS, path=('edges', 'node'),
+                              keep=[field for field, _ in ordering])
+        ingredients, has_next_page = keyset_page(ingredients, ordering, first, after)
+        return connection_from_rows(IngredientConnection, ingredients, ordering, has_next_page,
+                                    after)
+
+    autocomplete = graphene.Field(AutocompleteType,
+                                  prefix=graphene.String(required=True),
+                                  limit=graphene.Int(required=False))
+
+    def resolve_autocomplete(self, info, prefix, limit=10):
+        completions = autocomplete_index.complete(prefix, limit=limit)
+        return AutocompleteType(ingredients=completions[INGREDIENT],
+                                recipes=completions[RECIPE],
+                                sources=completions[SOURCE])
+
+    next_purchases = graphene.List(NextPurchaseType,
+                                   limit=graphene.Int(required=False),
+                                   allowances=graphene.Int(required=False),
+                                   weight_by=graphene.String(required=False),
+                                   greedy=graphene.Boolean(required=False))
+
+    def resolve_next_purchases(self, info, limit=10, allowances=0, weight_by=None, greedy=False):
+        # TODO: add auth
+        purchases = next_purchases(User.objects.first(), limit, allowances, weight_by, greedy)
+        # the unlocked recipes of every purchase are loaded together, each taking its own
+        unlocked = {}
+        if 'unlockedRecipes' in selected_fields(info):
+            recipe_ids = {recipe_id for purchase in purchases for recipe_id in purchase.recipe_ids}
+            recipes = plan_recipes(Recipe.objects.filter(id__in=recipe_ids), info,
+                                   path=('unlockedRecipes',))
+            unlocked = {recipe.id: recipe for recipe in recipes.order_by('-id')}
+        return [NextPurchaseType(
+                    ingredient=purchase.ingredient, score=purchase.score,
+                    unlocked_count=len(purchase.recipe_ids),
+                    unlocked_recipes=[recipe for recipe_id, recipe in unlocked.items()
+                                      if recipe_id in purchase.recipe_ids])
+                for purchase in purchases]
+
+    shopping_list = graphene.List(ShoppingListItemType,
+                                  scope=graphene.String(required=False),
+                                  servings=graphene.Int(required=False))
+
+    def resolve_shopping_list(self, info, scope='shortlist', servings=1):
+        # TODO: add auth
+        return shopping_list(User.objects.first(), scope, servings)
 
     get_ingredient = graphene.Field(IngredientType, id=graphene.Int(required=True))
 
     def resolve_get_ingredient(self, info, id):
-        return Ingredient.objects.get(id=id)
+        return project(Ingredient.objects.all(), info, INGREDIENT_COLUMNS).get(id=id)
 
     # {{recipeTable.pageSize}}
     # {{recipeTable.paginationOffset}}
\ No newline at end of file
@@ -0,0 +1,259 @@
+import re
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.lookups import PostgresSimpleLookup
+from django.contrib.postgres.search import SearchVector, SearchQuery
+from django.db.models import OuterRef, Subquery, F, Q, Count, Func, FloatField, Lookup, Value
+from django.db.models.functions import Cast
+
+from api.models import Recipe, RecipeIngredient, Ingredient
+from api.pagination import ordering_expressions
+from api.signals import search_documents_updated, ingredients_updated
+
+SEARCH_CONFIG = 'english_unaccent'
+SORTABLE_FIELDS = {'name', 'rating'}
+RELEVANCE = 'relevance'
+# added to the cover density rank (0 - 1) of a relevance sort
+NAME_MATCH_BOOST = 1.0
+PHRASE_MATCH_BOOST = 0.5
+FACET_FIELDS = ('shortlist', 'today', 'partner_likes', 'non_alcoholic')
+
+
+def _recipe_ingredient_text(field, recipe_ingredient_model=RecipeIngredient):
+    return Subquery(
+        recipe_ingredient_model.objects
+        .filter(beverage=OuterRef('pk'))
+        .values('beverage')
+        .annotate(text=StringAgg(field, delimiter=' ; '))
+        .values('text')
+    )
+
+
+def search_document_vector(recipe_ingredient_model=RecipeIngredient):
+    '''
+    The weighted document stored on Recipe.search_document.  Ingredient names and notes are
+    aggregated in subqueries so that the document can be written with a single UPDATE.
+    '''
+    return SearchVector('name', config=SEARCH_CONFIG, weight='A') + \
+        SearchVector(_recipe_ingredient_text('ingredient__name', recipe_ingredient_model),
+                     config=SEARCH_CONFIG, weight='A') + \
+        SearchVector(_recipe_ingredient_text('note', recipe_ingredient_model),
+                     config=SEARCH_CONFIG, weight='B') + \
+        SearchVector('source', config=SEARCH_CONFIG, weight='B') + \
+        SearchVector('source_url', config=SEARCH_CONFIG, weight='B')
+
+
+class TrigramWordSimilar(PostgresSimpleLookup):
+    '''
+    name__trigram_word_similar=text: the text is (a typo away from) a word of name, according to
+    pg_trgm.word_similarity_threshold.  Answered from a gin_trgm_ops index on the column.
+    '''
+    lookup_name = 'trigram_word_similar'
+    operator = '%%>'
+
+
+class AnyOf(Lookup):
+    '''
+    id__any=ids: the value is one of ids.  The ids go as a single array literal rather than a
+    parameter each as with __in, so matching tens of thousands of ids stays a short statement.
+    '''
+    lookup_name = 'any'
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', ['{%s}' % ','.join(str(int(item)) for item in value)]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} = ANY({rhs}::integer[])', lhs_params + rhs_params
+
+
+class TrigramWordSimilarity(Func):
+    function = 'WORD_SIMILARITY'
+    # as double precision, so the value read back (say into a cursor) compares equal in SQL
+    template = '%(function)s(%(expressions)s)::double precision'
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        super().__init__(string, expression, **extra)
+
+
+class SearchRankCD(Func):
+    '''ts_rank_cd of a search document for a query, scaled to 0 - 1 (normalization 32).'''
+    function = 'ts_rank_cd'
+    template = '%(function)s(%(expressions)s, 32)'
+    output_field = FloatField()
+
+
+class MatchBoost(Func):
+    '''boost when the tsvector matches the query, otherwise 0.'''
+    template = 'CASE WHEN %(expressions)s THEN %(boost)s ELSE 0 END'
+    arg_joiner = ' @@ '
+    output_field = FloatField()
+
+    def __init__(self, vector, query, boost, **extra):
+        super().__init__(vector, query, boost=float(boost), **extra)
+
+
+def set_trigram_threshold(sender, connection, **kwargs):
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)",
+                           [str(settings.TRIGRAM_WORD_SIMILARITY_THRESHOLD)])
+
+
+def update_search_documents(recipe_ids=None):
+    '''
+    Rebuilds the stored search document for the given recipe ids (or a queryset of ids), or for
+    every recipe when no ids are given.
+    '''
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    updated = recipes.update(search_document=search_document_vector())
+    search_documents_updated.send(sender=Recipe, recipe_ids=recipe_ids)
+    return updated
+
+
+def update_search_documents_for_ingredients(ingredient_ids):
+    ingredients_updated.send(sender=Ingredient, ingredient_ids=ingredient_ids)
+    return update_search_documents(
+        RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids)
+        .values_list('beverage_id', flat=True))
+
+
+def prefix_search_query(text):
+    '''
+    Matches any word of the text as a prefix ("chart" -> chart:*), which is what a partially
+    typed search needs while still being answerable from the GIN index.
+    '''
+    words = re.findall(r'[^\W_]+', text)
+    if not words:
+        return None
+    return SearchQuery(' | '.join(f'{word}:*' for word in words),
+                       search_type='raw', config=SEARCH_CONFIG)
+
+
+@dataclass
+class ParsedSearch:
+    terms: list = field(default_factory=list)
+    phrases: list = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.terms or self.phrases)
+
+
+def parse_search_term(search_term):
+    '''
+    Splits a search into its quoted phrases and its free terms.  Returns None when the quotes
+    are unbalanced.
+    '''
+    search_term = search_term or ''
+    if search_term.count('"') % 2 != 0:
+        return None
+    phrases = [phrase.strip() for phrase in re.findall('"([^"]*)"', search_term)]
+    terms = re.sub('"([^"]*)"', '', search_term).split()
+    return ParsedSearch(terms=terms, phrases=[phrase for phrase in phrases if phrase])
+
+
+def search_query(parsed):
+    '''
+    Any free term (as a prefix) and every quoted phrase must match, as one tsquery.
+    '''
+    query = prefix_search_query(' '.join(parsed.terms))
+    for phrase in parsed.phrases:
+        phrase_query = SearchQuery(phrase, search_type='phrase', config=SEARCH_CONFIG)
+        query = phrase_query if query is None else query & phrase_query
+    return query
+
+
+def _text_match(parsed):
+    if settings.RECIPE_SEARCH_BACKEND == 'memory':
+        from api.search_index import recipe_index
+        return Q(id__any=recipe_index.search(parsed))
+    query = search_query(parsed)
+    return Q() if query is None else Q(search_document=query)
+
+
+def _fuzzy_match(text):
+    return Q(name__trigram_word_similar=text) | Q(id__in=RecipeIngredient.objects.filter(
+        ingredient__name__trigram_word_similar=text).values('beverage_id'))
+
+
+def relevance_rank(parsed, fuzzy=False):
+    '''
+    How well a recipe matches the search: the cover density rank of its weighted document, plus
+    a boost when its name matches and when the free terms appear as an exact phrase.  With
+    fuzzy the trigram similarity of the name is added, as typo matches have no text rank.
+    '''
+    query = search_query(parsed)
+    rank = SearchRankCD(F('search_document'), query) + \
+        MatchBoost(SearchVector('name', config=SEARCH_CONFIG), query, NAME_MATCH_BOOST)
+    if len(parsed.terms) > 1:
+        phrase_query = SearchQuery(' '.join(parsed.terms), search_type='phrase',
+                                   config=SEARCH_CONFIG)
+        rank = rank + MatchBoost(F('search_document'), phrase_query, PHRASE_MATCH_BOOST)
+    if fuzzy and parsed.terms:
+        rank = rank + F('similarity')
+    return Cast(rank, FloatField())
+
+
+def recipe_search_counts():
+    '''The total of a recipe search and how many of its results have each facet flag set.'''
+    counts = {'total_count': Count('id')}
+    for flag in FACET_FIELDS:
+        counts[f'{flag}_count'] = Count('id', filter=Q(**{flag: True}))
+    return counts
+
+
+def recipe_ordering(parsed, sorted_by=None, desc=None, fuzzy=False):
+    '''The sort of a recipe search as (field, descending) pairs, see api.pagination.'''
+    if sorted_by in SORTABLE_FIELDS:
+        return [(sorted_by, bool(desc)), ('id', True)]
+    if sorted_by == RELEVANCE and parsed and search_query(parsed) is not None:
+        return [('rank', True), ('id', True)]
+    if fuzzy and parsed.terms:
+        return [('similarity', True), ('id', True)]
+    return [('id', True)]
+
+
+def plan_recipe_search(parsed, shortlist=False, today=False, partner_likes=False,
+                       sorted_by=None, desc=None, fuzzy=False):
+    '''
+    Turns a parsed search, its flags and sort into a single ordered queryset, so that a page
+    (or the count) of the results is one SQL statement.  With fuzzy, free terms may also be
+    typos of a recipe or ingredient name, and results are ranked by how close they are.
+    Sorting by relevance orders by relevance_rank; with a LIMIT on the page postgres keeps only
+    the top rows in a bounded heap rather than sorting every match.
+    '''
+    recipes = Recipe.objects.all()
+    ordering = recipe_ordering(parsed, sorted_by=sorted_by, desc=desc, fuzzy=fuzzy)
+
+    if not parsed:
+        recipes = recipes.only('id', 'owner', 'source', 'source_url', 'name', 'shortlist', 'today',
+                               'partner_likes', 'rating', 'non_alcoholic')
+    elif fuzzy and parsed.terms:
+        text = ' '.join(parsed.terms)
+        matches = _text_match(ParsedSearch(terms=parsed.terms)) | _fuzzy_match(text)
+        if parsed.phrases:
+            matches &= _text_match(ParsedSearch(phrases=parsed.phrases))
+        recipes = recipes.filter(matches).defer('search_document')\
+            .annotate(similarity=TrigramWordSimilarity(text, 'name'))
+    else:
+        recipes = recipes.filter(_text_match(parsed)).defer('search_document')
+
+    if ordering[0][0] == 'rank':
+        recipes = recipes.annotate(rank=relevance_rank(parsed, fuzzy=fuzzy))
+
+    if shortlist:
+        recipes = recipes.filter(shortlist=True)
+    if today:
+        recipes = recipes.filter(today=True)
+    if partner_likes:
+        recipes = recipes.filter(partner_likes=True)
+    return recipes.order_by(*ordering_expressions(ordering))
@@ -0,0 +1,208 @@
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db.models import Prefetch
+from nltk.corpus import stopwords
+from nltk.stem.snowball import SnowballStemmer
+
+from api.models import Recipe, RecipeIngredient
+
+_stemmer = SnowballStemmer('english')
+_stop_words = None
+
+
+def _is_stop_word(word):
+    global _stop_words
+    if _stop_words is None:
+        _stop_words = frozenset(stopwords.words('english'))
+    return word in _stop_words
+
+
+def tokenize(text):
+    '''
+    Splits text the way the english_unaccent configuration does: unaccented, lower cased,
+    snowball stemmed words.  Stop words are kept as None so phrase positions still line up.
+    '''
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return [None if _is_stop_word(word) else _stemmer.stem(word)
+            for word in re.findall(r'[^\W_]+', text)]
+
+
+def _contains_phrase(tokens, phrase):
+    width = len(phrase)
+    return any(
+        all(expected is None or tokens[start + offset] == expected
+            for offset, expected in enumerate(phrase))
+        for start in range(len(tokens) - width + 1)
+    )
+
+
+class InvertedIndex(object):
+    '''
+    In memory index of the recipe search document: every token maps to a sorted array of recipe
+    ids, and a forward index of token positions per recipe is kept to check quoted phrases.
+
+    The index is built on first use and kept current by marking recipes dirty from model
+    signals (see connect_signals); dirty recipes are reloaded in one query by the next search.
+    It lives in the process that serves the search, so writes made by other processes are only
+    seen after a rebuild.
+    '''
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings = {}
+        self._documents = {}
+        self._ingredient_recipes = defaultdict(set)
+        self._recipe_ingredients = {}
+        self._vocabulary = []
+        self._dirty = set()
+
+    @staticmethod
+    def _load(recipe_ids=None):
+        recipes = Recipe.objects.only('id', 'name', 'source', 'source_url').prefetch_related(
+            Prefetch('recipeingredient_set',
+                     queryset=RecipeIngredient.objects.select_related('ingredient')
+                     .only('id', 'beverage', 'note', 'ingredient__name')
+                     .order_by('id')))
+        if recipe_ids is not None:
+            recipes = recipes.filter(id__in=recipe_ids)
+        return recipes
+
+    def build(self):
+        with self._lock:
+            self._postings = {}
+            self._documents = {}
+            self._ingredient_recipes = defaultdict(set)
+            self._recipe_ingredients = {}
+            self._dirty = set()
+            for recipe in self._load():
+                self._add(recipe)
+            self._vocabulary = sorted(self._postings)
+            self._built = True
+
+    def mark_dirty(self, recipe_ids=None):
+        with self._lock:
+            if not self._built:
+                return
+            if recipe_ids is None:
+                self._built = False
+            else:
+                self._dirty.update(recipe_ids)
+
+    def mark_ingredient_dirty(self, ingredient_id):
+        with self._lock:
+            self.mark_dirty(self._ingredient_recipes.get(ingredient_id, ()))
+
+    def _add(self, recipe):
+        recipe_ingredients = list(recipe.recipeingredient_set.all())
+        tokens = tokenize(recipe.name)
+        for recipe_ingredient in recipe_ingredients:
+            tokens += tokenize(recipe_ingredient.ingredient.name)
+            self._ingredient_recipes[recipe_ingredient.ingredient_id].add(recipe.id)
+        for recipe_ingredient in recipe_ingredients:
+            tokens += tokenize(recipe_ingredient.note)
+        tokens += tokenize(recipe.source) + tokenize(recipe.source_url)
+
+        self._documents[recipe.id] = tuple(tokens)
+        self._recipe_ingredients[recipe.id] = {ri.ingredient_id for ri in recipe_ingredients}
+        for token in set(tokens) - {None}:
+            postings = self._postings.setdefault(token, array('I'))
+            if not postings or postings[-1] < recipe.id:
+                postings.append(recipe.id)
+            else:
+                insort(postings, recipe.id)
+
+    def _remove(self, recipe_id):
+        tokens = self._documents.pop(recipe_id, ())
+        for token in set(tokens) - {None}:
+            postings = self._postings[token]
+            del postings[bisect_left(postings, recipe_id)]
+            if not postings:
+                del self._postings[token]
+        for ingredient_id in self._recipe_ingredients.pop(recipe_id, ()):
+            self._ingredient_recipes[ingredient_id].discard(recipe_id)
+
+    def _refresh(self):
+        if not self._built:
+            self.build()
+        elif self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            for recipe_id in dirty:
+                self._remove(recipe_id)
+            for recipe in self._load(dirty):
+                self._add(recipe)
+            self._vocabulary = sorted(self._postings)
+
+    def _prefix_matches(self, prefix):
+        matches = set()
+        for token in self._vocabulary[bisect_left(self._vocabulary, prefix):]:
+            if not token.startswith(prefix):
+                break
+            matches.update(self._postings[token])
+        return matches
+
+    def _phrase_matches(self, phrase):
+        tokens = tokenize(phrase)
+        words = [token for token in tokens if token is not None]
+        if not words:
+            return set()
+        postings = sorted((self._postings.get(word, ()) for word in set(words)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {recipe_id for recipe_id in candidates
+                if _contains_phrase(self._documents[recipe_id], tokens)}
+
+    def search(self, parsed):
+        '''
+        Recipe ids matching any of the free terms (as prefixes) and all of the quoted phrases,
+        the same semantics as api.search.search_query.
+        '''
+        with self._lock:
+            self._refresh()
+            matches = None
+            prefixes = [token for term in parsed.terms for token in tokenize(term) if token]
+            if prefixes:
+                matches = set()
+                for prefix in prefixes:
+                    matches |= self._prefix_matches(prefix)
+            for phrase in parsed.phrases:
+                phrase_matches = self._phrase_matches(phrase)
+                matches = phrase_matches if matches is None else matches & phrase_matches
+            return matches if matches is not None else set(self._documents)
+
+
+recipe_index = InvertedIndex()
+
+
+def _recipe_changed(sender, instance, **kwargs):
+    recipe_index.mark_dirty([instance.id])
+
+
+def _recipe_ingredient_changed(sender, instance, **kwargs):
+    recipe_index.mark_dirty([instance.beverage_id])
+
+
+def _ingredient_changed(sender, instance, **kwargs):
+    recipe_index.mark_ingredient_dirty(instance.id)
+
+
+def _search_documents_updated(sender, recipe_ids, **kwargs):
+    recipe_index.mark_dirty(recipe_ids)
+
+
+def connect_signals():
+    from django.db.models.signals import post_save, post_delete
+
+    from api.models import Ingredient
+    from api.signals import search_documents_updated
+
+    for signal in (post_save, post_delete):
+        signal.connect(_recipe_changed, sender=Recipe)
+        signal.connect(_recipe_ingredient_changed, sender=RecipeIngredient)
+        signal.connect(_ingredient_changed, sender=Ingredient)
+    search_documents_updated.connect(_search_documents_updated)
@@ -0,0 +1,132 @@
+from collections import OrderedDict, defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import ast
+
+
+def _selections(info, selection_set):
+    for selection in selection_set.selections if selection_set else ():
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.InlineFragment):
+            yield from _selections(info, selection.selection_set)
+        elif isinstance(selection, ast.FragmentSpread):
+            yield from _selections(info, info.fragments[selection.name.value].selection_set)
+
+
+def selected_fields(info):
+    '''The (camel cased) names of the fields selected on the field being resolved.'''
+    return {selection.name.value
+            for field_ast in info.field_asts
+            for selection in _selections(info, field_ast.selection_set)}
+
+
+class Fetch(object):
+    '''
+    A relation a field needs prefetched: its lookup, the queryset to fetch it with and the
+    select_related paths that always go along, plus the relations of the fetched type when the
+    field's own selections may reach further (planned from them in turn, see plan_related).
+    '''
+
+    def __init__(self, lookup, queryset, to_attr=None, select=(), relations=None, columns=None):
+        self.lookup = lookup
+        self.queryset = queryset
+        self.to_attr = to_attr
+        self.select = select
+        self.relations = relations
+        # projected from the field's selections when set, see project
+        self.columns = columns
+
+    @property
+    def key(self):
+        return self.to_attr or self.lookup
+
+
+def _selected(info, field_asts):
+    selected = defaultdict(list)
+    for field_ast in field_asts:
+        for selection in _selections(info, field_ast.selection_set):
+            selected[selection.name.value].append(selection)
+    return selected
+
+
+def _walk(info, field_asts, path):
+    field_asts = info.field_asts if field_asts is None else field_asts
+    for name in path:
+        field_asts = _selected(info, field_asts)[name]
+    return field_asts
+
+
+def plan_related(queryset, info, relations, field_asts=None, path=()):
+    '''
+    queryset with exactly the select_related and prefetch_related that the selected fields
+    need, so that rows load in the same number of statements whatever their number.  relations
+    maps a (camel cased) field name to what resolving it reads: select_related paths and Fetch
+    relations, fields sharing a Fetch key share its prefetch.  path leads from the field being
+    resolved to the rows of queryset, ('edges', 'node') for a connection.
+    '''
+    field_asts = _walk(info, field_asts, path)
+
+    selects, fetches = set(), OrderedDict()
+    for name, selections in _selected(info, field_asts).items():
+        for related in relations.get(name, ()):
+            if isinstance(related, Fetch):
+                fetches.setdefault(related.key, (related, []))[1].extend(selections)
+            else:
+                selects.add(related)
+
+    if selects:
+        queryset = queryset.select_related(*sorted(selects))
+    for fetch, selections in fetches.values():
+        fetched = fetch.queryset.all()
+        if fetch.select:
+            fetched = fetched.select_related(*fetch.select)
+        if fetch.relations:
+            fetched = plan_related(fetched, info, fetch.relations, selections)
+        if fetch.columns is not None:
+            fetched = project(fetched, info, fetch.columns, selections)
+        queryset = queryset.prefetch_related(
+            Prefetch(fetch.lookup, queryset=fetched, to_attr=fetch.to_attr))
+    return queryset
+
+
+def _column(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field.name if field.concrete and not field.many_to_many else None
+
+
+def selected_columns(info, model, columns=None, field_asts=None, path=()):
+    '''
+    The names of the fields of model that the selected fields read: the model fields selected
+    directly and, for the rest such as custom resolvers, the fields columns (a camel cased
+    field name to field names) declares they depend on.  The primary key is always read.
+    '''
+    columns = columns or {}
+    names = {model._meta.pk.name}
+    for name in _selected(info, _walk(info, field_asts, path)):
+        names.update(columns.get(name, ()))
+        column = _column(model, to_snake_case(name))
+        if column is not None:
+            names.add(column)
+    return names
+
+
+def project(queryset, info, columns=None, field_asts=None, path=(), keep=()):
+    '''
+    queryset loading only the columns the selected fields read (see selected_columns) rather
+    than whole rows, plus the relations it selects or sets along and the fields of keep that
+    are columns, such as those a cursor is made of.
+    '''
+    model = queryset.model
+    names = selected_columns(info, model, columns, field_asts, path)
+    names.update(filter(None, (_column(model, name) for name in keep)))
+    if isinstance(queryset.query.select_related, dict):
+        names.update(queryset.query.select_related)
+    # a related manager's queryset sets the instance it came from on every row
+    names.update(field.name for field in queryset._known_related_objects)
+    return queryset.only(*sorted(names))
@@ -0,0 +1,61 @@
+from collections import OrderedDict, defaultdict
+
+from django.db.models import Q
+
+from api.makeability import in_stock_names
+from api.models import Ingredient, RecipeIngredient
+from api.units import conversion
+
+SCOPES = {
+    'shortlist': Q(beverage__shortlist=True),
+    'today': Q(beverage__today=True),
+    'planned': Q(beverage__shortlist=True) | Q(beverage__today=True),
+}
+
+
+class ShoppingListItem(object):
+    def __init__(self, ingredient_id):
+        self.ingredient_id = ingredient_id
+        self.ingredient = None
+        self.amounts = defaultdict(float)
+        # servings that call for the ingredient without an amount, like "top with soda"
+        self.unmeasured = 0
+        self.recipe_ids = set()
+
+
+def shopping_list(user, scope='shortlist', servings=1):
+    '''
+    Everything the recipes in scope need that the user's pantry doesn't have, by ingredient
+    name, with the amounts for servings of each recipe summed per canonical unit (see
+    api.units).  The ingredients of every recipe are read in one query.
+    '''
+    if scope not in SCOPES:
+        raise Exception(f'scope must be one of {", ".join(SCOPES)}')
+    if servings is None or servings < 1:
+        raise Exception('servings must be a positive number')
+
+    recipe_ingredients = RecipeIngredient.objects.filter(SCOPES[scope])\
+        .values_list('beverage_id', 'ingredient_id', 'ingredient__name', 'quantity__amount',
+                     'quantity__divisor', 'quantity__unit__name')\
+        .order_by('ingredient__name', 'id')
+    stocked = in_stock_names(user)
+
+    items = OrderedDict()
+    for recipe_id, ingredient_id, name, amount, divisor, unit_name in recipe_ingredients:
+        if name in stocked:
+            continue
+        item = items.get(name)
+        if item is None:
+            item = items[name] = ShoppingListItem(ingredient_id)
+        item.recipe_ids.add(recipe_id)
+        if amount is None:
+            item.unmeasured += servings
+            continue
+        factor, unit = conversion(unit_name)
+        value = float(amount / divisor if divisor else amount)
+        item.amounts[unit] += value * factor * servings
+
+    ingredients = Ingredient.objects.in_bulk([item.ingredient_id for item in items.values()])
+    for item in items.values():
+        item.ingredient = ingredients.get(item.ingredient_id)
+    return list(items.values())
@@ -0,0 +1,17 @@
+from django.dispatch import Signal
+
+# Sent by api.search.update_search_documents with the ids of the recipes whose searchable text
+# changed (None meaning every recipe).  Unlike post_save this also covers queryset updates, such
+# as ingredient renames and merges.
+search_documents_updated = Signal(providing_args=['recipe_ids'])
+
+# Sent with the ids of ingredients that were renamed or merged into through queryset updates.
+ingredients_updated = Signal(providing_args=['ingredient_ids'])
+
+# Sent by api.categories with the ids of the categories that ingredients were added to or
+# removed from, directly or through other categories.
+categories_updated = Signal(providing_args=['ingredient_ids'])
+
+# Sent with the ids of pantries whose ingredients were changed without post_save, such as by
+# bulk_create, and the ids of those ingredients (None meaning any of them).
+pantry_updated = Signal(providing_args=['pantry_ids', 'ingredient_ids'])
@@ -33,5 +33,15 @@ class ToggleStockResponseGraphql(graphene.ObjectType):
     toggled_to = graphene.Boolean()
 
 
+class SetStockResponseGraphql(graphene.ObjectType):
+    pantry_ingredient_ids = graphene.List(graphene.Int)
+    count = graphene.Int()
+
+
 class EditIngredientFlexibleResponseGraphql(graphene.ObjectType):
-    added = graphene.Boolean()
\ No newline at end of file
+    added = graphene.Boolean()
+
+
+class ImportRecipeFromUrlResponseGraphql(graphene.ObjectType):
+    job_id = graphene.Int()
+    status = graphene.String()
@@ -0,0 +1,43 @@
+from functools import lru_cache
+
+import pint
+
+# The one registry for the app, quantities from different registries can't be combined.
+units = pint.UnitRegistry()
+units.define('dash = fluid_ounce / 32 = _ = dashes')
+units.define('barspoon = 5 * milliliter = _ = barspoons')
+units.define('drop = 0.05 * milliliter = _ = drops')
+
+# names recipes use that pint reads differently (oz is a weight there) or not at all
+UNIT_ALIASES = {
+    'oz': 'fluid_ounce',
+    'ounce': 'fluid_ounce',
+    'ounces': 'fluid_ounce',
+    'millileter': 'milliliter',
+    'millileters': 'milliliter',
+}
+
+# volumes are summed in ounces, weights in grams
+CANONICAL_UNITS = (
+    (units.fluid_ounce, 'oz'),
+    (units.gram, 'g'),
+)
+
+
+@lru_cache(maxsize=None)
+def conversion(unit_name):
+    '''
+    The factor from unit_name to its canonical unit and that unit's name, or (1, unit_name) for
+    names that are not a volume or weight, such as slice or none at all.
+    '''
+    if not unit_name:
+        return 1.0, unit_name
+    name = unit_name.strip().lower()
+    try:
+        unit = units.parse_units(UNIT_ALIASES.get(name, name))
+    except (pint.errors.UndefinedUnitError, ValueError, AttributeError):
+        return 1.0, unit_name
+    for canonical, canonical_name in CANONICAL_UNITS:
+        if unit.dimensionality == canonical.dimensionality:
+            return units.Quantity(1, unit).to(canonical).magnitude, canonical_name
+    return 1.0, unit_name
@@ -5,10 +5,12 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from graphql import GraphQLError
 
+from api.categories import update_closure
 from api.individual_recipe_parser import INGREDIENT_PARSER, JUICE_OF_PARSER, \
     ALTERNATIVE_UNIT_LOCATION_PARSER
 from api.models import Recipe, Ingredient, Unit, Quantity, RecipeIngredient, IngredientMapping, \
     IngredientToIngredient
+from api.search import update_search_documents
 
 
 class RecipeValidator(object):
@@ -37,6 +39,7 @@ class RecipeValidator(object):
                 self.save_and_add_ingredient(ingredient)
 
             self.save_and_add_garnish()
+            update_search_documents([self.recipe.id])
         else:
             print(f'duplicate found for {self.recipe.name}')
 
@@ -56,6 +59,7 @@ class RecipeValidator(object):
         for ingredient in self.ingredients:
             self.save_and_add_ingredient(ingredient)
         self.save_and_add_garnish(update=True)
+        update_search_documents([self.recipe.id])
 
     def with_user(self, user):
         self.user = user
@@ -163,8 +167,10 @@ class RecipeValidator(object):
                     name=capwords(' '.join((specific_ingredient, base_ingredient))),
                     owner=self.user)
                 try:
-                    IngredientToIngredient.objects.get_or_create(child=ingredient_instance,
-                                                                 parent_id=base.id)
+                    _, created = IngredientToIngredient.objects.get_or_create(
+                        child=ingredient_instance, parent_id=base.id)
+                    if created:
+                        update_closure([ingredient_instance.id])
                 except IngredientToIngredient.MultipleObjectsReturned:
                     all_rels = IngredientToIngredient.objects.filter(child=ingredient_instance,
                                                                      parent_id=base.id)
@@ -1,3 +1,53 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.http import HttpResponseBadRequest
+from graphene_django.views import GraphQLView, HttpError
+
+from api.persisted import resolve_query, DocumentCacheBackend, PersistedQueryError
+
+# shared by every request, the view itself is made anew for each
+backend = DocumentCacheBackend()
+
+
+def _persisted_hash(request, data):
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+    persisted = (extensions or {}).get('persistedQuery') or {}
+    return persisted.get('sha256Hash')
+
+
+class HomebarGraphQLView(GraphQLView):
+    '''
+    The GraphQL endpoint: operations over the cost limit are rejected before they run (see
+    api.cost), persisted queries can be run by their hash (see api.persisted), and responses
+    carry the extensions of their result, such as the cost.
+    '''
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('backend', backend)
+        super().__init__(**kwargs)
+        self._extensions = None
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        try:
+            query = resolve_query(self.schema, query, _persisted_hash(request, data))
+        except PersistedQueryError as e:
+            raise HttpError(HttpResponseBadRequest(str(e)), str(e))
+        return query, variables, operation_name, id
+
+    def execute_graphql_request(self, *args, **kwargs):
+        self._extensions = None
+        result = super().execute_graphql_request(*args, **kwargs)
+        self._extensions = getattr(result, 'extensions', None)
+        return result
+
+    def json_encode(self, request, d, pretty=False):
+        # called with the response of each operation of a batch in turn
+        if self._extensions and isinstance(d, dict):
+            d = dict(d, extensions=self._extensions)
+        return super().json_encode(request, d, pretty=pretty)
@@ -136,6 +136,21 @@ GRAPHENE = {
     ],
 }
 
+# operations whose cost (see api.cost.query_cost) is over this are rejected before they run,
+# None to only report the cost
+GRAPHQL_COST_LIMIT = 5000
+
+# with True only the queries registered with manage.py register_persisted_queries can be run, by
+# their sha256 hash (see api.persisted)
+PERSISTED_QUERIES_ONLY = False
+# whether clients sending a query along with its hash register it (automatic persisted queries),
+# and how many they may register at most (None for no limit)
+PERSISTED_QUERIES_CLIENT_REGISTRATION = False
+PERSISTED_QUERIES_CLIENT_LIMIT = 1000
+# how many parsed and validated documents (and persisted documents read) are kept for queries
+# that are sent again
+GRAPHQL_DOCUMENT_CACHE_SIZE = 500
+
 AUTHENTICATION_BACKENDS = [
     'graphql_jwt.backends.JSONWebTokenBackend',
     'django.contrib.auth.backends.ModelBackend',
@@ -171,4 +186,36 @@ QUERYCOUNT = {
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440 * 20
 
+# 'postgres' searches the stored full text search document, 'memory' answers searched_recipes
+# from the in process inverted index in api.search_index
+RECIPE_SEARCH_BACKEND = 'postgres'
+
+# 'table' reads the ingredients a recipe is missing from the pantry (allowances) from the pantry
+# recipe statuses kept by api.pantry_status, 'postgres' counts them in the search query and
+# 'memory' uses the in process bitset index in api.makeability.  The statuses are only kept up to
+# date with 'table', run manage.py rebuild_pantry_statuses after switching back to it.
+PANTRY_FILTER_BACKEND = 'table'
+
+# how close a fuzzy search term has to be to a word of an ingredient or recipe name (0 - 1)
+TRIGRAM_WORD_SIMILARITY_THRESHOLD = 0.5
+
+# threads that scrape recipe urls queued by a url search or importRecipeFromUrl (see api.jobs)
+URL_IMPORT_WORKERS = 2
+
+# 'search' holds searched_recipes results (see api.cache), keyed by data versions kept in the
+# database, so each process may have its own
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+}
+
 from  django.core.handlers.wsgi import WSGIRequest
\ No newline at end of file
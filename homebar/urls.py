@@ -17,11 +17,10 @@ from django.conf.urls import url
 from django.contrib import admin
 from django.views.decorators.csrf import csrf_exempt
 
-from graphene_django.views import GraphQLView
-
+from api.views import HomebarGraphQLView
 from schema import schema
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
-    url(r'^graphql', csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    url(r'^graphql', csrf_exempt(HomebarGraphQLView.as_view(graphiql=True, schema=schema))),
 ]